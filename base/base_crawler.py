@@ -1,12 +1,12 @@
 from abc import ABC, abstractmethod
 from playwright.async_api import async_playwright, BrowserContext, BrowserType
-from typing import Optional, Dict, Tuple, List
+from typing import Optional, Dict, Tuple, List, Set
 
 
 class AbstractCrawler(ABC):
 
     @abstractmethod
-    def init_config(self, platform: str, login_type: str, crawler_type: str):
+    def init_config(self, platform: str, login_type: str, crawler_type: str, resume: bool = False):
         pass
 
     @abstractmethod
@@ -53,3 +53,46 @@ class AbstractStore(ABC):
     @abstractmethod
     async def store_creator(self, creator: Dict):
         pass
+
+    async def open(self):
+        """打开存储(建立连接、打开文件等), 在第一次写入前调用"""
+        pass
+
+    async def flush(self):
+        """把缓冲中的数据写入存储"""
+        pass
+
+    async def close(self):
+        """刷新并关闭存储, 程序退出前调用"""
+        pass
+
+    async def store_contents(self, content_items: List[Dict]):
+        """批量存储内容, 支持批量写入的存储方式可以重写为一次写入"""
+        for content_item in content_items:
+            await self.store_content(content_item)
+
+    async def store_comments(self, comment_items: List[Dict]):
+        """批量存储评论, 支持批量写入的存储方式可以重写为一次写入"""
+        for comment_item in comment_items:
+            await self.store_comment(comment_item)
+
+    async def query_content_state(self, content_id: str) -> Optional[Dict]:
+        """
+        查询已存储内容的更新时间和评论数, 用于增量爬取
+        不支持查询的存储方式返回 None, 此时按全量爬取处理
+        """
+        return None
+
+    async def query_stored_comment_ids(self, comment_ids: List[str]) -> Set[str]:
+        """查询哪些评论已经存储过, 用于增量爬取评论"""
+        return set()
+
+
+class AbstractSigner(ABC):
+    @abstractmethod
+    async def sign(self, uri: str, data: Optional[Dict] = None) -> Dict[str, str]:
+        pass
+
+    @abstractmethod
+    async def update_cookies(self, cookie_dict: Dict[str, str]):
+        pass
@@ -2,7 +2,8 @@
 PLATFORM = "xhs"
 KEYWORDS = "python,go"
 LOGIN_TYPE = "qrcode"  # qrcode or phone or cookie
-SORT_TYPE = "popularity_descending"
+COOKIES = ""
+SORT_TYPE = "popular_descending"  # general | popular_descending | time_descending
 CRAWLER_TYPE = "search"  # 爬取类型，search:关键词搜索｜detail:帖子详情 | creator:创作者主页数据
 
 # 是否开启IP代理
@@ -17,8 +18,20 @@ HEADLESS = False
 # 是否保存登陆状态
 SAVE_LOGIN_STATE = True
 
-# 数据保存类型选项配置,支持三种类型：csv、db、json
-SAVE_DATA_OPTION = "db"  # csv or db or json
+# 数据保存类型选项配置,支持五种类型：csv、db(MySQL)、json(json lines 格式)、parquet(需要安装 pyarrow)、sqlite
+SAVE_DATA_OPTION = "db"  # csv or db or json or parquet or sqlite
+
+# json lines 存储单个文件的最大大小(MB)，超过后切分出新文件，每天也会切分
+JSONL_MAX_FILE_SIZE_MB = 256
+
+# json lines 存储是否使用 gzip 压缩切分后的旧文件
+JSONL_COMPRESS_ROTATED = True
+
+# parquet 存储每个文件的行数，攒够一个行组就写成一个完整的 part 文件，程序退出时写入剩余数据
+PARQUET_ROW_GROUP_SIZE = 10000
+
+# parquet 存储的压缩算法 (zstd | snappy | gzip | none)
+PARQUET_COMPRESSION = "zstd"
 
 # 用户浏览器缓存的浏览器文件配置
 USER_DATA_DIR = "%s_user_data_dir"  # %s will be replaced by platform name
@@ -29,9 +42,134 @@ CRAWLER_MAX_NOTES_COUNT = 100
 # 并发爬虫数量控制
 MAX_CONCURRENCY_NUM = 4
 
+# 签名方式: browser 浏览器页面签名 | js_engine 进程内JS引擎签名(需要安装quickjs, 只在登录时启动浏览器)
+# | sign_server 使用本地签名服务签名(先运行 python sign_server.py, 多个爬虫进程共享一个浏览器)
+XHS_SIGN_MODE = "browser"
+
+# 本地签名服务地址, sign_server.py 默认也监听这个地址
+XHS_SIGN_SERVER_URL = "http://127.0.0.1:8989"
+
+# 本地签名服务的访问令牌, 签名服务和爬虫进程配置同一个值, 请求时放在 Authorization: Bearer 请求头中
+# 为空时签名服务不提供 /cookies 接口(会返回登录态 cookies), sign_server 签名方式必须配置
+XHS_SIGN_SERVER_TOKEN = ""
+
+# js_engine 签名方式执行的签名脚本, 脚本需要定义 window._webmsxyw(url, data)
+XHS_SIGN_JS_PATH = "libs/xhs_sign.js"
+
+# 登录态(cookies 和 localStorage 中的 b1)保存路径, js_engine 签名方式从这里恢复登录态
+XHS_SIGN_STATE_PATH = "browser_data/xhs_sign_state.json"
+
+# 签名页面数量, 同一个浏览器中开启多个页面并行签名, 建议不超过CPU核数
+XHS_SIGN_PAGE_COUNT = 2
+
+# 签名页面健康检查间隔(秒), 页面崩溃后会自动重建
+XHS_SIGN_HEALTH_CHECK_INTERVAL = 30
+
+# 是否开启HTTP/2, 开启需要安装 httpx[http2], 未安装 h2 时打印警告并退回 HTTP/1.1
+ENABLE_HTTP2 = True
+
+# HTTP连接池最大连接数, 请求都发往同一个API域名, 相当于单域名的连接数上限
+HTTP_MAX_CONNECTIONS = 20
+
+# HTTP连接池最大保持空闲的长连接数量
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+
+# 空闲长连接保持时间(秒)
+HTTP_KEEPALIVE_EXPIRY = 30
+
+# 是否开启自适应请求限速(令牌桶), 开启后不再在评论翻页之间随机sleep
+# 请求成功时速率加性增加, 遇到IP限制(300012)或HTTP 429/461时速率乘性降低
+ENABLE_RATE_LIMIT = True
+
+# 初始请求速率(次/秒), 全局和每个接口各自一个令牌桶
+RATE_LIMIT_INIT_RATE = 2
+
+# 最小/最大请求速率(次/秒)
+RATE_LIMIT_MIN_RATE = 0.2
+RATE_LIMIT_MAX_RATE = 10
+
+# 每次请求成功增加的速率
+RATE_LIMIT_INCREASE_STEP = 0.05
+
+# 被限流时速率乘以该系数
+RATE_LIMIT_DECREASE_FACTOR = 0.5
+
+# 请求失败最大重试次数, 只有网络异常、IP被限制、签名失效这几类错误会重试
+XHS_REQUEST_MAX_RETRIES = 3
+
+# 熔断配置: 时间窗口(秒)内IP被限制的次数达到阈值后, 暂停所有请求一段时间(秒)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_WINDOW = 60
+CIRCUIT_BREAKER_RECOVERY_TIMEOUT = 120
+
+# 搜索流水线各阶段(笔记详情、存储、评论)之间的队列长度, 队列满时上游阶段会等待, 控制内存占用
+PIPELINE_QUEUE_SIZE = 20
+
+# 是否开启已爬取笔记过滤, 过期天数内爬取过的笔记(跨关键词、跨次运行)不再重复获取详情
+ENABLE_SEEN_NOTE_FILTER = True
+
+# 已爬取笔记的过期天数, 超过后会重新爬取
+SEEN_NOTE_TTL_DAYS = 1
+
+# 已爬取笔记过滤器(布隆过滤器)文件保存目录
+SEEN_NOTE_FILTER_DIR = "data/xhs/.seen"
+
+# 每天预计爬取的笔记数量和误判率, 用于计算布隆过滤器大小
+SEEN_NOTE_FILTER_CAPACITY = 100000
+SEEN_NOTE_FILTER_ERROR_RATE = 0.001
+
+# 是否开启增量爬取(需要存储方式支持查询已存储的数据), 笔记最后更新时间和评论数都没有变化时跳过,
+# 有变化时只存储新评论
+ENABLE_INCREMENTAL_CRAWL = False
+
+# 增量爬取评论时遇到第一条已存储的评论就停止翻页, 只适用于评论按时间倒序返回的情况,
+# 小红书的评论按热度排序返回，默认关闭，继续翻页并跳过已存储的评论
+INCREMENTAL_STOP_AT_STORED_COMMENT = False
+
+# 按最新排序(SORT_TYPE = "time_descending")搜索时是否使用水位线, 记录每个关键词上一次爬到的最新笔记时间,
+# 翻页越过该时间后停止翻页, 持续监控关键词时每轮只需要很少的请求
+ENABLE_SEARCH_WATERMARK = True
+
+# 关键词水位线保存路径
+SEARCH_WATERMARK_PATH = "data/xhs/.state/search_watermark.json"
+
+# 是否记录爬取进度日志，崩溃或中断后可以使用 --resume 参数从中断的位置继续爬取
+ENABLE_CRAWL_CHECKPOINT = True
+
+# 爬取进度日志文件路径
+CRAWL_CHECKPOINT_PATH = "data/xhs/.state/crawl_checkpoint.jsonl"
+
+# 是否开启写缓冲，数据先放入内存缓冲区，由后台任务批量写入存储，存储变慢时不会直接拖慢爬取
+ENABLE_STORE_WRITE_BEHIND = True
+
+# 写缓冲中的数据达到多少条时写入存储
+STORE_FLUSH_BATCH_SIZE = 200
+
+# 写缓冲最长多少秒写入一次存储
+STORE_FLUSH_INTERVAL = 2
+
+# 写缓冲中的数据达到多少条时，爬虫等待写入完成后再继续(限制内存占用)
+STORE_MAX_PENDING = 2000
+
+# 写缓冲中同一条数据最多连续写入失败几次，超过后记录日志并丢弃(例如字段校验失败的数据)，不阻塞其他数据的写入
+STORE_FLUSH_MAX_RETRIES = 10
+
+# 是否根据内容指纹跳过没有变化的数据写入(db 和 sqlite 存储)，重复爬取时大部分数据没有变化，可以减少大量数据库写入
+ENABLE_CONTENT_HASH_SKIP = True
+
+# db 存储在内存中缓存的内容指纹数量
+CONTENT_HASH_CACHE_SIZE = 200000
+
 # 是否开启爬评论模式, 默认不开启爬评论
 ENABLE_GET_COMMENTS = True
 
+# 是否开启爬二级评论(回复)模式, 开启后会并发爬取有回复的一级评论下的所有回复
+ENABLE_GET_SUB_COMMENTS = False
+
+# 单个笔记最多爬取的评论页数/评论数量, 0表示不限制
+CRAWLER_MAX_COMMENT_PAGES_PER_NOTE = 0
+CRAWLER_MAX_COMMENTS_PER_NOTE = 0
+
 # 指定小红书需要爬虫的笔记ID列表
 XHS_SPECIFIED_ID_LIST = [
     "6422c2750000000027000d88",
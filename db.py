@@ -1,8 +1,54 @@
+import argparse
 import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
 import tortoise
 from tortoise import Tortoise, run_async
+from tortoise.backends.base.client import BaseDBAsyncClient
 import config
+from tools import utils
+from tools.count_parser import parse_counts
+
+# 需要转换成整数的数量字段: 表名 -> [(展示值字段, 整数字段, 字段说明)]
+COUNT_COLUMNS: Dict[str, List[tuple]] = {
+    "xhs_note": [
+        ("liked_count", "liked_count_num", "笔记点赞数(整数)"),
+        ("collected_count", "collected_count_num", "笔记收藏数(整数)"),
+        ("comment_count", "comment_count_num", "笔记评论数(整数)"),
+        ("share_count", "share_count_num", "笔记分享数(整数)"),
+    ],
+    "xhs_creator": [
+        ("follows", "follows_num", "关注数(整数)"),
+        ("fans", "fans_num", "粉丝数(整数)"),
+        ("interaction", "interaction_num", "获赞和收藏数(整数)"),
+    ],
+}
+
+# 表的唯一键: 表名 -> 唯一键字段
+UNIQUE_KEYS: Dict[str, str] = {
+    "xhs_note": "note_id",
+    "xhs_note_comment": "comment_id",
+}
+
+# 迁移时需要补充的字段: 表名 -> [(字段名, 字段定义)]
+MIGRATE_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "xhs_note": [
+        ("content_hash", "CHAR(32) NULL COMMENT '内容指纹, 内容没有变化时跳过写入'"),
+    ],
+    "xhs_note_comment": [
+        ("parent_comment_id", "VARCHAR(64) NULL COMMENT '一级评论ID, 一级评论为空'"),
+        ("content_hash", "CHAR(32) NULL COMMENT '内容指纹, 内容没有变化时跳过写入'"),
+    ],
+    "xhs_creator": [
+        ("content_hash", "CHAR(32) NULL COMMENT '内容指纹, 内容没有变化时跳过写入'"),
+    ],
+}
+
+# 迁移时需要补充的索引: 表名 -> [索引字段]
+MIGRATE_INDEXES: Dict[str, List[Tuple[str, ...]]] = {
+    "xhs_note_comment": [("note_id", "create_time"), ("parent_comment_id",)],
+}
 
 
 def get_platform_models():
@@ -16,15 +62,291 @@ async def init_db(create_db: bool = False) -> None:
         _create_db=create_db,
         modules={'models': get_platform_models()}
     )
+    # 建库建表时由 main 中转换分区后再维护
+    if config.ENABLE_DB_PARTITION and not create_db:
+        await maintain_partitions()
 
 
 async def close() -> None:
     await Tortoise.close_connections()
 
 
+async def get_table_columns(conn: BaseDBAsyncClient, table: str) -> List[str]:
+    rows = await conn.execute_query_dict(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        [table]
+    )
+    return [row["COLUMN_NAME"] for row in rows]
+
+
+async def get_table_indexes(conn: BaseDBAsyncClient, table: str) -> Dict[str, Dict]:
+    """
+    查询表上的索引
+    :return: 索引名 -> {"unique": 是否唯一索引, "columns": [按顺序的索引字段]}
+    """
+    rows = await conn.execute_query_dict(
+        "SELECT INDEX_NAME, NON_UNIQUE, COLUMN_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY INDEX_NAME, SEQ_IN_INDEX",
+        [table]
+    )
+    indexes: Dict[str, Dict] = {}
+    for row in rows:
+        index = indexes.setdefault(row["INDEX_NAME"], {"unique": not row["NON_UNIQUE"], "columns": []})
+        index["columns"].append(row["COLUMN_NAME"])
+    return indexes
+
+
+async def migrate() -> None:
+    """
+    把已有数据库的表结构迁移到当前的模型定义:
+    1. 补充缺少的字段
+    2. 删除唯一键重复的记录，每个唯一键只保留自增ID最大(最后写入)的一条
+    3. 唯一键上原来的普通索引替换为唯一索引
+    4. 补充缺少的索引
+    :return:
+    """
+    conn = Tortoise.get_connection("default")
+    for table, columns in MIGRATE_COLUMNS.items():
+        existing_columns = await get_table_columns(conn, table)
+        if not existing_columns:
+            continue
+        alter_clauses = [f"ADD COLUMN `{column}` {definition}" for column, definition in columns
+                         if column not in existing_columns]
+        if alter_clauses:
+            utils.logger.info(f"[db.migrate] alter table {table}: {alter_clauses}")
+            await conn.execute_script(f"ALTER TABLE `{table}` {', '.join(alter_clauses)}")
+
+    for table, unique_key in UNIQUE_KEYS.items():
+        indexes = await get_table_indexes(conn, table)
+        if not indexes:
+            continue
+        # 分区表的唯一索引是 (唯一键, 分区字段)
+        if any(index["unique"] and index["columns"][0] == unique_key for index in indexes.values()):
+            continue
+        deleted_count, _ = await conn.execute_query(
+            f"DELETE t1 FROM `{table}` t1 JOIN `{table}` t2 "
+            f"ON t1.`{unique_key}` = t2.`{unique_key}` AND t1.`id` < t2.`id`"
+        )
+        utils.logger.info(f"[db.migrate] table {table} deleted {deleted_count} duplicate rows")
+        alter_clauses = [f"DROP INDEX `{index_name}`" for index_name, index in indexes.items()
+                         if not index["unique"] and index["columns"] == [unique_key]]
+        alter_clauses.append(f"ADD UNIQUE INDEX `uidx_{table}_{unique_key}` (`{unique_key}`)")
+        utils.logger.info(f"[db.migrate] alter table {table}: {alter_clauses}")
+        await conn.execute_script(f"ALTER TABLE `{table}` {', '.join(alter_clauses)}")
+
+    for table, migrate_indexes in MIGRATE_INDEXES.items():
+        indexes = await get_table_indexes(conn, table)
+        if not indexes:
+            continue
+        for index_columns in migrate_indexes:
+            if any(index["columns"][:len(index_columns)] == list(index_columns) for index in indexes.values()):
+                continue
+            index_name = f"idx_{table}_{'_'.join(index_columns)}"
+            utils.logger.info(f"[db.migrate] create index {index_name} on {table}")
+            await conn.execute_script(
+                f"ALTER TABLE `{table}` ADD INDEX `{index_name}` ({', '.join(f'`{c}`' for c in index_columns)})"
+            )
+
+
+def get_partition_period_start(dt: datetime) -> datetime:
+    """分区周期的开始时间"""
+    if config.DB_PARTITION_INTERVAL == "day":
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_next_partition_period(period_start: datetime) -> datetime:
+    if config.DB_PARTITION_INTERVAL == "day":
+        return period_start + timedelta(days=1)
+    return (period_start + timedelta(days=32)).replace(day=1)
+
+
+def make_partition_clause(period_start: datetime) -> str:
+    """分区定义，分区名为周期开始日期，保存分区字段(毫秒时间戳)小于下一个周期开始时间的数据"""
+    name_format = "p%Y%m%d" if config.DB_PARTITION_INTERVAL == "day" else "p%Y%m"
+    upper_bound = int(get_next_partition_period(period_start).timestamp() * 1000)
+    return f"PARTITION {period_start.strftime(name_format)} VALUES LESS THAN ({upper_bound})"
+
+
+def make_partition_clauses(start: datetime, end: datetime) -> List[str]:
+    """从 start 所在的周期到 end 所在的周期(包含)的分区定义"""
+    clauses = []
+    period_start = get_partition_period_start(start)
+    while period_start <= end:
+        clauses.append(make_partition_clause(period_start))
+        period_start = get_next_partition_period(period_start)
+    return clauses
+
+
+def get_precreate_end() -> datetime:
+    """需要提前创建分区的最后时间"""
+    end = get_partition_period_start(datetime.now())
+    for _ in range(config.DB_PARTITION_PRECREATE):
+        end = get_next_partition_period(end)
+    return end
+
+
+async def get_table_partitions(conn: BaseDBAsyncClient, table: str) -> List[Tuple[str, Optional[int]]]:
+    """
+    查询表的分区
+    :return: [(分区名, 分区上界)]，按上界升序，MAXVALUE 分区的上界为 None，表未分区时返回空列表
+    """
+    rows = await conn.execute_query_dict(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION",
+        [table]
+    )
+    return [(row["PARTITION_NAME"],
+             None if row["PARTITION_DESCRIPTION"] == "MAXVALUE" else int(row["PARTITION_DESCRIPTION"]))
+            for row in rows]
+
+
+async def partition_tables() -> None:
+    """
+    把未分区的表转换为按时间范围分区的表
+    MySQL 分区表的主键和唯一索引必须包含分区字段，主键改为 (id, 分区字段)，唯一键改为 (唯一键, 分区字段)，
+    同一条数据的时间字段不会变化，upsert 仍然按唯一键判断冲突
+    表中已有数据时从最早的数据所在周期开始创建分区，另外创建一个 pmax 分区保存超出范围的数据
+    :return:
+    """
+    conn = Tortoise.get_connection("default")
+    for table, partition_column in config.DB_PARTITION_TABLES.items():
+        if await get_table_partitions(conn, table):
+            continue
+        indexes = await get_table_indexes(conn, table)
+        if not indexes:
+            continue
+        unique_key = UNIQUE_KEYS[table]
+        alter_clauses = ["DROP PRIMARY KEY", f"ADD PRIMARY KEY (`id`, `{partition_column}`)"]
+        alter_clauses += [f"DROP INDEX `{index_name}`" for index_name, index in indexes.items()
+                          if index_name != "PRIMARY" and index["unique"] and index["columns"] == [unique_key]]
+        alter_clauses.append(f"ADD UNIQUE INDEX `uidx_{table}_{unique_key}` (`{unique_key}`, `{partition_column}`)")
+        utils.logger.info(f"[db.partition_tables] alter table {table}: {alter_clauses}")
+        await conn.execute_script(f"ALTER TABLE `{table}` {', '.join(alter_clauses)}")
+
+        rows = await conn.execute_query_dict(f"SELECT MIN(`{partition_column}`) AS min_time FROM `{table}`")
+        min_time = rows[0]["min_time"] if rows else None
+        start = datetime.fromtimestamp(min_time / 1000) if min_time else datetime.now()
+        partition_clauses = make_partition_clauses(start, get_precreate_end())
+        partition_clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        utils.logger.info(f"[db.partition_tables] partition table {table} by {partition_column} "
+                          f"into {len(partition_clauses)} partitions")
+        await conn.execute_script(
+            f"ALTER TABLE `{table}` PARTITION BY RANGE (`{partition_column}`) ({', '.join(partition_clauses)})"
+        )
+
+
+async def maintain_partitions() -> None:
+    """
+    维护分区表: 提前创建后续周期的分区(从 pmax 分区中拆分，pmax 没有数据时只修改元数据)，
+    删除超出保留时间的分区(直接删除整个分区，不需要逐行删除)
+    :return:
+    """
+    conn = Tortoise.get_connection("default")
+    now_ms = utils.get_current_timestamp()
+    for table in config.DB_PARTITION_TABLES:
+        partitions = await get_table_partitions(conn, table)
+        if not partitions:
+            utils.logger.warning(f"[db.maintain_partitions] table {table} is not partitioned, "
+                                 f"run `python db.py partition` first")
+            continue
+        upper_bounds = [upper_bound for _, upper_bound in partitions if upper_bound is not None]
+        if upper_bounds and partitions[-1][1] is None:
+            start = datetime.fromtimestamp(max(upper_bounds) / 1000)
+            partition_clauses = make_partition_clauses(start, get_precreate_end())
+            if partition_clauses:
+                partition_clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+                utils.logger.info(f"[db.maintain_partitions] table {table} add {len(partition_clauses) - 1} partitions")
+                await conn.execute_script(
+                    f"ALTER TABLE `{table}` REORGANIZE PARTITION pmax INTO ({', '.join(partition_clauses)})"
+                )
+
+        if config.DB_PARTITION_RETENTION_DAYS <= 0:
+            continue
+        expire_before = now_ms - config.DB_PARTITION_RETENTION_DAYS * 24 * 3600 * 1000
+        expired_partitions = [name for name, upper_bound in partitions
+                              if upper_bound is not None and upper_bound <= expire_before]
+        # 至少保留一个有上界的分区
+        if len(expired_partitions) >= len(upper_bounds):
+            expired_partitions = expired_partitions[:-1]
+        if expired_partitions:
+            utils.logger.info(f"[db.maintain_partitions] table {table} drop expired partitions {expired_partitions}")
+            await conn.execute_script(f"ALTER TABLE `{table}` DROP PARTITION {', '.join(expired_partitions)}")
+
+
+async def backfill_counts(batch_size: int = 1000) -> None:
+    """
+    给已有数据补充整数数量字段: 表中缺少整数字段时先添加字段和索引，再按自增ID分批解析展示值并回填
+    :param batch_size: 每批处理的行数
+    :return:
+    """
+    conn = Tortoise.get_connection("default")
+    for table, count_columns in COUNT_COLUMNS.items():
+        existing_columns = await get_table_columns(conn, table)
+        if not existing_columns:
+            continue
+        alter_clauses = []
+        for _, num_column, description in count_columns:
+            if num_column not in existing_columns:
+                alter_clauses.append(f"ADD COLUMN `{num_column}` BIGINT NULL COMMENT '{description}'")
+                alter_clauses.append(f"ADD INDEX `idx_{table}_{num_column}` (`{num_column}`)")
+        if alter_clauses:
+            utils.logger.info(f"[db.backfill_counts] alter table {table}: {alter_clauses}")
+            await conn.execute_script(f"ALTER TABLE `{table}` {', '.join(alter_clauses)}")
+
+        select_columns = ", ".join(f"`{column}`" for column, _, _ in count_columns)
+        update_sql = (f"UPDATE `{table}` SET {', '.join(f'`{num_column}` = %s' for _, num_column, _ in count_columns)} "
+                      f"WHERE `id` = %s")
+        last_id, updated_count = 0, 0
+        while True:
+            rows = await conn.execute_query_dict(
+                f"SELECT `id`, {select_columns} FROM `{table}` WHERE `id` > %s ORDER BY `id` LIMIT %s",
+                [last_id, batch_size]
+            )
+            if not rows:
+                break
+            parsed_columns = [parse_counts(row[column] for row in rows) for column, _, _ in count_columns]
+            values = [[*parsed_values, row["id"]] for row, *parsed_values in zip(rows, *parsed_columns)]
+            await conn.execute_many(update_sql, values)
+            last_id = rows[-1]["id"]
+            updated_count += len(rows)
+        utils.logger.info(f"[db.backfill_counts] table {table} backfilled {updated_count} rows")
+
+
 async def main():
+    parser = argparse.ArgumentParser(description="database management")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("init", help="create the database and tables (default)")
+    backfill_parser = subparsers.add_parser("backfill-counts",
+                                            help="add integer counter columns and backfill them for existing rows")
+    backfill_parser.add_argument("--batch-size", type=int, default=1000, help="rows per batch")
+    subparsers.add_parser("migrate", help="add missing columns, deduplicate rows, then add unique constraints "
+                                          "and indexes to an existing database")
+    subparsers.add_parser("partition", help="convert the tables in DB_PARTITION_TABLES into time range "
+                                            "partitioned tables, then create upcoming / drop expired partitions")
+    args = parser.parse_args()
+
+    if args.command == "partition":
+        await init_db()
+        await partition_tables()
+        await maintain_partitions()
+        return
+
+    if args.command == "migrate":
+        await init_db()
+        await migrate()
+        return
+
+    if args.command == "backfill-counts":
+        await init_db()
+        await backfill_counts(args.batch_size)
+        return
     await init_db(create_db=True)
     await Tortoise.generate_schemas()
+    if config.ENABLE_DB_PARTITION:
+        await partition_tables()
+        await maintain_partitions()
 
 
 if __name__ == '__main__':
@@ -5,6 +5,7 @@ import config
 import db
 from base.base_crawler import AbstractCrawler
 from media_platform.xhs import XiaoHongShuCrawler
+from store.store_manager import StoreManager
 
 
 class CrawlerFactory:
@@ -28,6 +29,8 @@ async def main():
                         help="Login type (qrcode | phone | cookie)")
     parser.add_argument('--type', type=str, help='crawler type (search | detail | creator)',
                         choices=["search", "detail", "creator"], default=config.CRAWLER_TYPE)
+    parser.add_argument('--resume', action='store_true',
+                        help='resume the crawl from the last checkpoint after a crash or interruption')
 
     args = parser.parse_args()
 
@@ -38,13 +41,19 @@ async def main():
     crawler.init_config(
         platform=args.platform,
         login_type=args.lt,
-        crawler_type=args.type
+        crawler_type=args.type,
+        resume=args.resume
     )
 
-    await crawler.start()
-
-    if config.SAVE_DATA_OPTION == 'db':
-        await db.close()
+    try:
+        await crawler.start()
+    finally:
+        # 退出前把写缓冲中的数据全部写入存储
+        try:
+            await StoreManager.close_all()
+        finally:
+            if config.SAVE_DATA_OPTION == 'db':
+                await db.close()
 
 
 if __name__ == '__main__':
@@ -1,12 +1,20 @@
 import asyncio
 import json
-from typing import Dict, Any, Union, Optional, Callable, List
-from urllib.parse import urlencode
+from collections import Counter
+from typing import Dict, Any, Union, Optional, Callable, List, AsyncIterator
+from urllib.parse import urlencode, urlparse
 import httpx
 from playwright.async_api import Page, BrowserContext
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+from .exception import (XHSRequestError, NetworkError, IPBlockError, SignatureExpiredError, NoteAbnormalError,
+                        LoginExpiredError, DataFetchError)
 from .field import SearchNoteType, SearchSortType
-from .help import get_search_id, sign
+from base.base_crawler import AbstractSigner
+from .help import get_search_id
+from .signer import XHSPageSigner
 from tools import utils
+from tools.circuit_breaker import CircuitBreaker
+from tools.rate_limiter import RateLimiter
 
 
 class XHSClient:
@@ -17,10 +25,18 @@ class XHSClient:
             *,
             headers: Dict[str, str],
             playwright_page: Page,
-            cookie_dict: Dict[str, str]
+            cookie_dict: Dict[str, str],
+            signer: Optional[AbstractSigner] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            circuit_breaker: Optional[CircuitBreaker] = None,
+            max_retries: int = 3,
+            http2: bool = True,
+            limits: Optional[httpx.Limits] = None
     ):
         self.proxies = proxies
         self.timeout = timeout
+        self.http2 = http2
+        self.limits = limits or httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30)
         self.headers = headers
         self._host = "https://edith.xiaohongshu.com"
         self._domain = "https://www.xiaohongshu.com"
@@ -28,8 +44,56 @@ class XHSClient:
         self.IP_ERROR_CODE = 300012
         self.NOTE_ABNORMAL_STR = "笔记状态异常，请稍后查看"
         self.NOTE_ABNORMAL_CODE = -510001
+        self.LOGIN_EXPIRED_CODE = -100
+        self.SIGNATURE_EXPIRED_CODE = 300015
+        self.THROTTLED_STATUS_CODES = (429, 461)
+        self.SIGNATURE_ERROR_STATUS_CODES = (406,)
         self.playwright_page = playwright_page
         self.cookie_dict = cookie_dict
+        self.signer = signer or XHSPageSigner(playwright_page, cookie_dict)
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self.max_retries = max_retries
+        self.error_counter: Counter = Counter()
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+    async def open(self) -> None:
+        """
+        创建长连接的httpx客户端，所有请求共用同一个连接池，避免每次请求都重新进行TCP+TLS握手
+        :return:
+        """
+        if self._http_client is not None:
+            return
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                utils.logger.warning("[XHSClient.open] h2 is not installed, fall back to HTTP/1.1, "
+                                     "install httpx[http2] to enable HTTP/2")
+                self.http2 = False
+        self._http_client = httpx.AsyncClient(
+            proxies=self.proxies,
+            timeout=self.timeout,
+            http2=self.http2,
+            limits=self.limits
+        )
+
+    async def close(self) -> None:
+        """
+        关闭连接池，释放所有连接
+        :return:
+        """
+        if self._http_client is None:
+            return
+        await self._http_client.aclose()
+        self._http_client = None
+
+    async def __aenter__(self) -> "XHSClient":
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
 
     async def pong(self) -> bool:
         """
@@ -64,50 +128,100 @@ class XHSClient:
         return await self.post(uri, data)
 
     async def post(self, uri: str, data: dict) -> Dict:
-        headers = await self._pre_headers(uri, data)
         json_str = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
-        return await self.request(method="POST", url=f"{self._host}{uri}", data=json_str, headers=headers)
+        return await self.signed_request("POST", uri, data=data, content=json_str)
 
-    async def _pre_headers(self, url: str, data=None) -> Dict:
-        encrypt_params = await self.playwright_page.evaluate("([url, data]) => window._webmsxyw(url,data)", [url, data])
-        local_storage = await self.playwright_page.evaluate("() => window.localStorage")
-        signs = sign(
-            a1=self.cookie_dict.get("a1", ""),
-            b1=local_storage.get("b1", ""),
-            x_s=encrypt_params.get("X-s", ""),
-            x_t=str(encrypt_params.get("X-t", ""))
-        )
+    async def signed_request(self, method: str, uri: str, data: Optional[Dict] = None, **kwargs) -> Dict:
+        """
+        签名并发送请求，网络异常、IP被限制、签名失效这几类错误会带随机抖动地指数退避重试，每次重试都会重新签名
+        :param method: 请求方法
+        :param uri: 请求路由(GET请求需带上查询参数)
+        :param data: 参与签名的请求体
+        :return:
+        """
+        async for attempt in AsyncRetrying(
+                retry=retry_if_exception(lambda e: isinstance(e, XHSRequestError) and e.retriable),
+                stop=stop_after_attempt(self.max_retries + 1),
+                wait=wait_random_exponential(multiplier=1, max=30),
+                reraise=True
+        ):
+            with attempt:
+                headers = await self._pre_headers(uri, data)
+                return await self.request(method=method, url=f"{self._host}{uri}", headers=headers, **kwargs)
 
-        headers = {
-            "X-S": signs["x-s"],
-            "X-T": signs["x-t"],
-            "x-S-Common": signs["x-s-common"],
-            "X-B3-Traceid": signs["x-b3-traceid"]
-        }
-        self.headers.update(headers)
-        return self.headers
+    async def _pre_headers(self, url: str, data=None) -> Dict:
+        """
+        请求头签名，每个请求都拿到自己独立的请求头字典
+        :param url: 请求路由
+        :param data: 请求体
+        :return:
+        """
+        sign_headers = await self.signer.sign(url, data)
+        return {**self.headers, **sign_headers}
 
     async def request(self, method, url, **kwargs) -> Union[str, Any]:
+        endpoint = urlparse(url).path
+        if self.circuit_breaker:
+            await self.circuit_breaker.wait_until_closed()
+        if self.rate_limiter:
+            await self.rate_limiter.acquire(endpoint)
+        try:
+            result = await self._send(method, url, **kwargs)
+        except XHSRequestError as e:
+            self.error_counter[e.error_type] += 1
+            if isinstance(e, IPBlockError):
+                if self.rate_limiter:
+                    self.rate_limiter.on_throttled(endpoint)
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_failure()
+            elif isinstance(e, SignatureExpiredError):
+                # 签名失效时丢弃签名器缓存的 b1，重试时重新读取
+                await self.signer.update_cookies(self.cookie_dict)
+            raise
+        if self.rate_limiter:
+            self.rate_limiter.on_success(endpoint)
+        return result
+
+    async def _send(self, method, url, **kwargs) -> Union[str, Any]:
+        """发送一次请求，并把失败的响应转换成对应类型的异常"""
         return_response = kwargs.pop('return_response', False)
-        async with httpx.AsyncClient(proxies=self.proxies) as client:
-            response = await client.request(
-                method, url, timeout=self.timeout,
-                **kwargs
-            )
+        if self._http_client is None:
+            await self.open()
+        try:
+            response = await self._http_client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            raise NetworkError(f"{type(e).__name__}: {e}") from e
+        if response.status_code in self.THROTTLED_STATUS_CODES:
+            raise IPBlockError(f"http status {response.status_code}")
+        if response.status_code in self.SIGNATURE_ERROR_STATUS_CODES:
+            raise SignatureExpiredError(f"http status {response.status_code}")
+        if response.status_code >= 500:
+            raise NetworkError(f"http status {response.status_code}")
         if return_response:
             return response.text
-        data: Dict = response.json()
-        if data["success"]:
+        try:
+            data: Dict = response.json()
+        except ValueError as e:
+            raise DataFetchError(f"invalid json response, http status {response.status_code}") from e
+        if data.get("success"):
             return data.get("data", data.get("success", {}))
-        elif data["code"] == self.IP_ERROR_CODE:
-            pass
+        code, msg = data.get("code"), data.get("msg", "")
+        if code == self.IP_ERROR_CODE:
+            raise IPBlockError(msg or self.IP_ERROR_STR)
+        elif code == self.NOTE_ABNORMAL_CODE:
+            raise NoteAbnormalError(msg or self.NOTE_ABNORMAL_STR)
+        elif code == self.LOGIN_EXPIRED_CODE:
+            raise LoginExpiredError(msg)
+        elif code == self.SIGNATURE_EXPIRED_CODE:
+            raise SignatureExpiredError(msg)
         else:
-            pass
+            raise DataFetchError(f"code: {code}, msg: {msg}")
 
     async def update_cookies(self, browser_context: BrowserContext):
         cookie_str, cookie_dict = utils.convert_cookies(await browser_context.cookies())
         self.headers["Cookie"] = cookie_str
         self.cookie_dict = cookie_dict
+        await self.signer.update_cookies(cookie_dict)
 
     async def get_note_by_id(self, note_id: str) -> Dict:
         """获取笔记详情API"""
@@ -123,27 +237,59 @@ class XHSClient:
                                     callback: Optional[Callable] = None) -> List[Dict]:
         """
         获取指定笔记下的所有一级评论，该方法会一直查找一个帖子下的所有评论信息
+        评论数量很大时会占用大量内存，只需要处理评论时请使用 iter_note_comments
         :param note_id:
         :param crawl_interval:
         :param callback:
         :return:
         """
         result = []
-        comments_has_more = True
-        comments_cursor = ""
-        while comments_has_more:
-            comments_res = await self.get_note_comments(note_id, comments_cursor)
-            comments_has_more = comments_res.get("has_more", False)
-            comments_cursor = comments_res.get("cursor", "")
-            if "comments" not in comments_res:
-                break
-            comments = comments_res["comments"]
+        async for comments_page in self.iter_note_comments(note_id, crawl_interval=crawl_interval):
+            comments = comments_page["comments"]
             if callback:
                 await callback(note_id, comments)
-            await asyncio.sleep(crawl_interval)
             result.extend(comments)
         return result
 
+    async def iter_note_comments(self, note_id: str, cursor: str = "", crawl_interval: float = 0,
+                                 max_pages: Optional[int] = None, max_comments: Optional[int] = None,
+                                 semaphore: Optional[asyncio.Semaphore] = None) -> AsyncIterator[Dict]:
+        """
+        逐页获取一级评论的异步生成器，每次产出一页评论 {"comments": [...], "cursor": "...", "has_more": bool}，
+        不会在内存中累积整个评论串
+        :param note_id: 笔记ID
+        :param cursor: 起始分页游标
+        :param crawl_interval: 翻页间隔(秒)
+        :param max_pages: 最多获取的评论页数
+        :param max_comments: 最多获取的评论数量
+        :param semaphore: 每次翻页请求都需要获取的并发信号量
+        :return:
+        """
+        pages_count, comments_count = 0, 0
+        comments_has_more = True
+        while comments_has_more:
+            if max_pages is not None and pages_count >= max_pages:
+                return
+            if semaphore:
+                async with semaphore:
+                    comments_res = await self.get_note_comments(note_id, cursor)
+            else:
+                comments_res = await self.get_note_comments(note_id, cursor)
+            comments_has_more = comments_res.get("has_more", False)
+            cursor = comments_res.get("cursor", "")
+            if "comments" not in comments_res:
+                return
+            comments: List[Dict] = comments_res["comments"]
+            if max_comments is not None:
+                comments = comments[:max_comments - comments_count]
+            pages_count += 1
+            comments_count += len(comments)
+            yield {"comments": comments, "cursor": cursor, "has_more": comments_has_more}
+            if max_comments is not None and comments_count >= max_comments:
+                return
+            if comments_has_more and crawl_interval:
+                await asyncio.sleep(crawl_interval)
+
     async def get_note_comments(self, note_id: str, cursor: str = "") -> Dict:
         """
         获取一级评论的API
@@ -160,6 +306,56 @@ class XHSClient:
         }
         return await self.get(uri, params)
 
+    async def get_note_sub_comments(self, note_id: str, root_comment_id: str, cursor: str = "",
+                                    num: int = 10) -> Dict:
+        """
+        获取二级评论(回复)的API
+        :param note_id: 笔记ID
+        :param root_comment_id: 一级评论ID
+        :param cursor: 分页游标
+        :param num: 每页数量
+        :return:
+        """
+        uri = "/api/sns/web/v2/comment/sub/page"
+        params = {
+            "note_id": note_id,
+            "root_comment_id": root_comment_id,
+            "num": num,
+            "cursor": cursor,
+            "image_formats": "jpg,webp,avif"
+        }
+        return await self.get(uri, params)
+
+    async def iter_note_sub_comments(self, note_id: str, root_comment: Dict, crawl_interval: float = 0,
+                                     semaphore: Optional[asyncio.Semaphore] = None) -> AsyncIterator[Dict]:
+        """
+        逐页获取一条一级评论下所有回复的异步生成器，一级评论中自带的前几条回复作为第一页产出，
+        之后从 sub_comment_cursor 开始翻页
+        :param note_id: 笔记ID
+        :param root_comment: 一级评论
+        :param crawl_interval: 翻页间隔(秒)
+        :param semaphore: 每次翻页请求都需要获取的并发信号量
+        :return:
+        """
+        root_comment_id = root_comment.get("id")
+        cursor = root_comment.get("sub_comment_cursor", "")
+        sub_comments_has_more = root_comment.get("sub_comment_has_more", False)
+        if root_comment.get("sub_comments"):
+            yield {"comments": root_comment["sub_comments"], "cursor": cursor, "has_more": sub_comments_has_more}
+        while sub_comments_has_more:
+            if crawl_interval:
+                await asyncio.sleep(crawl_interval)
+            if semaphore:
+                async with semaphore:
+                    sub_comments_res = await self.get_note_sub_comments(note_id, root_comment_id, cursor)
+            else:
+                sub_comments_res = await self.get_note_sub_comments(note_id, root_comment_id, cursor)
+            sub_comments_has_more = sub_comments_res.get("has_more", False)
+            cursor = sub_comments_res.get("cursor", "")
+            if "comments" not in sub_comments_res:
+                return
+            yield {"comments": sub_comments_res["comments"], "cursor": cursor, "has_more": sub_comments_has_more}
+
     async def get(self, uri: str, params=None) -> Dict:
         """
         GET请求，对请求头签名
@@ -171,5 +367,4 @@ class XHSClient:
         if isinstance(params, dict):
             final_uri = (f"{uri}?"
                          f"{urlencode(params)}")
-        headers = await self._pre_headers(final_uri)
-        return await self.request(method="GET", url=f"{self._host}{final_uri}", headers=headers)
+        return await self.signed_request("GET", final_uri)
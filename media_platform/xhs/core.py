@@ -1,16 +1,27 @@
 import asyncio
+import json
 import os.path
+import pathlib
 import random
 
+import httpx
+
 import config
-from base.base_crawler import AbstractCrawler
+from base.base_crawler import AbstractCrawler, AbstractSigner
 from tools import utils
+from tools.checkpoint import CrawlCheckpoint
+from tools.circuit_breaker import CircuitBreaker
+from tools.rate_limiter import RateLimiter
+from tools.seen_filter import SeenFilter
+from tools.watermark import SearchWatermark
 from proxy.proxy_ip_pool import create_ip_pool, IpInfoModel
-from typing import Tuple, Optional, Dict, List
-from playwright.async_api import async_playwright, BrowserType, BrowserContext
+from typing import Tuple, Optional, Dict, List, Set
+from playwright.async_api import async_playwright, BrowserType, BrowserContext, Page
 from .client import XHSClient
+from .exception import XHSRequestError, LoginExpiredError
 from .login import XHSLogin
-from .field import SearchNoteType, SearchSortType
+from .signer import XHSSignerPool, XHSJsEngineSigner, XHSRemoteSigner
+from .field import SearchSortType
 from store import xhs as xhs_store
 from asyncio import Task
 
@@ -22,12 +33,16 @@ class XiaoHongShuCrawler(AbstractCrawler):
 
     def __init__(self) -> None:
         self.index_url = "https://www.xiaohongshu.com"
-        self.user_agent = utils.get_user_agent
+        self.user_agent = utils.get_user_agent()
+        self.resume = False
+        self.checkpoint: Optional[CrawlCheckpoint] = None
+        self.resume_note_ids: Set[str] = set()
 
-    def init_config(self, platform: str, login_type: str, crawler_type: str) -> None:
+    def init_config(self, platform: str, login_type: str, crawler_type: str, resume: bool = False) -> None:
         self.platform = platform
         self.login_type = login_type
         self.crawler_type = crawler_type
+        self.resume = resume
 
     async def start(self) -> None:
         playwright_proxy_format, httpx_proxy_format = None, None
@@ -36,40 +51,160 @@ class XiaoHongShuCrawler(AbstractCrawler):
             ip_proxy_info: IpInfoModel = await ip_proxy_pool.get_proxy()
             playwright_proxy_format, httpx_proxy_format = self.format_proxy_info(ip_proxy_info)
 
+        if config.XHS_SIGN_MODE == "js_engine":
+            await self.start_without_browser(httpx_proxy_format)
+            return
+        if config.XHS_SIGN_MODE == "sign_server":
+            await self.start_with_sign_server(httpx_proxy_format)
+            return
+
         async with async_playwright() as playwright:
-            chromium = playwright.chromium
-            self.browser_context = await self.launch_browser(
-                chromium,
-                None,
-                self.user_agent,
-                headless=config.HEADLESS
+            await self.open_browser(playwright)
+            _, cookie_dict = utils.convert_cookies(await self.browser_context.cookies())
+            self.signer_pool = await XHSSignerPool.create(
+                page_factory=self.new_sign_page,
+                cookie_dict=cookie_dict,
+                pool_size=config.XHS_SIGN_PAGE_COUNT,
+                first_page=self.context_page,
+                health_check_interval=config.XHS_SIGN_HEALTH_CHECK_INTERVAL
             )
-            await self.browser_context.add_init_script(path="libs/stealth.min.js")
-            await self.browser_context.add_cookies(
-                [{
-                    'name': "webId",
-                    'value': "xxx123",  # any value
-                    'domain': ".xiaohongshu.com",
-                    'path': "/"
-                }]
-            )
-            self.context_page = await self.browser_context.new_page()
-            await self.context_page.goto(self.index_url)
-
-            self.xhs_client = await self.create_xhs_client(httpx_proxy_format)
-            if not await self.xhs_client.pong():
-                login_obj = XHSLogin(
-                    login_type=self.login_type,
-                    login_phone="",  # input your phone number
-                    browser_context=self.browser_context,
-                    context_page=self.context_page,
-                    cookie_str=config.COOKIES
-                )
-                await login_obj.begin()
-                await self.xhs_client.update_cookies(browser_context=self.browser_context)
+            self.xhs_client = await self.create_xhs_client(httpx_proxy_format, self.signer_pool)
+            async with self.xhs_client:
+                try:
+                    if not await self.xhs_client.pong():
+                        await self.login()
+                    await self.save_sign_state()
+                    await self.crawl()
+                finally:
+                    await self.signer_pool.close()
+
+    async def start_without_browser(self, httpx_proxy: Optional[Dict]) -> None:
+        """
+        无浏览器模式，签名在进程内的JS引擎中完成，只有登录态失效需要重新登录时才启动浏览器
+        :param httpx_proxy:
+        :return:
+        """
+        sign_state = self.load_sign_state()
+        # 签名和请求头要使用登录时浏览器的 User-Agent，和登录态不一致容易被风控
+        self.user_agent = sign_state.get("user_agent") or self.user_agent
+        _, cookie_dict = utils.convert_cookies(sign_state.get("cookies"))
+        signer = XHSJsEngineSigner(
+            script_path=config.XHS_SIGN_JS_PATH,
+            cookie_dict=cookie_dict,
+            local_storage=sign_state.get("local_storage"),
+            user_agent=self.user_agent
+        )
+        self.xhs_client = await self.create_xhs_client(httpx_proxy, signer, sign_state.get("cookies", []))
+        async with self.xhs_client:
+            try:
+                if not await self.xhs_client.pong():
+                    async with async_playwright() as playwright:
+                        await self.open_browser(playwright)
+                        await self.login()
+                        await self.save_sign_state()
+                        await signer.update_local_storage(self.load_sign_state().get("local_storage", {}))
+                        await self.browser_context.close()
+                await self.crawl()
+            finally:
+                await signer.close()
+
+    async def start_with_sign_server(self, httpx_proxy: Optional[Dict]) -> None:
+        """
+        使用本地签名服务签名，不启动浏览器，登录态也由签名服务提供
+        :param httpx_proxy:
+        :return:
+        """
+        signer = XHSRemoteSigner(config.XHS_SIGN_SERVER_URL, token=config.XHS_SIGN_SERVER_TOKEN)
+        try:
+            login_state = await signer.fetch_login_state()
+            self.user_agent = login_state.get("user_agent") or self.user_agent
+            self.xhs_client = await self.create_xhs_client(httpx_proxy, signer, login_state.get("cookies", []))
+            async with self.xhs_client:
+                if not await self.xhs_client.pong():
+                    utils.logger.error("[XiaoHongShuCrawler.start_with_sign_server] sign server login state is "
+                                       "invalid, please login again on the sign server")
+                    return
+                await self.crawl()
+        finally:
+            await signer.close()
+
+    async def open_browser(self, playwright) -> None:
+        """启动浏览器并打开小红书首页"""
+        self.browser_context = await self.launch_browser(
+            playwright.chromium,
+            None,
+            self.user_agent,
+            headless=config.HEADLESS
+        )
+        await self.browser_context.add_init_script(path="libs/stealth.min.js")
+        await self.browser_context.add_cookies(
+            [{
+                'name': "webId",
+                'value': "xxx123",  # any value
+                'domain': ".xiaohongshu.com",
+                'path': "/"
+            }]
+        )
+        self.context_page = await self.browser_context.new_page()
+        await self.context_page.goto(self.index_url)
+
+    async def login(self) -> None:
+        login_obj = XHSLogin(
+            login_type=self.login_type,
+            login_phone="",  # input your phone number
+            browser_context=self.browser_context,
+            context_page=self.context_page,
+            cookie_str=config.COOKIES
+        )
+        await login_obj.begin()
+        await self.xhs_client.update_cookies(browser_context=self.browser_context)
 
+    async def crawl(self) -> None:
+        try:
             if self.crawler_type == "search":
                 await self.search()
+        finally:
+            self.log_metrics()
+
+    def log_metrics(self) -> None:
+        """爬取结束后输出签名器、限流器、熔断器的统计信息和各类请求错误的次数"""
+        signer_metrics = self.xhs_client.signer.metrics() if hasattr(self.xhs_client.signer, "metrics") else None
+        if isinstance(signer_metrics, dict):
+            signer_metrics = [signer_metrics]
+        for index, page_metrics in enumerate(signer_metrics or []):
+            utils.logger.info(f"[XiaoHongShuCrawler.log_metrics] sign page {index}: "
+                              f"sign_count={page_metrics['sign_count']}, "
+                              f"avg_wait={page_metrics['avg_wait_time'] * 1000:.1f}ms, "
+                              f"max_wait={page_metrics['max_wait_time'] * 1000:.1f}ms")
+        if self.xhs_client.rate_limiter:
+            rates = ", ".join(f"{endpoint}={rate:.2f}/s"
+                              for endpoint, rate in self.xhs_client.rate_limiter.metrics().items())
+            utils.logger.info(f"[XiaoHongShuCrawler.log_metrics] request rates: {rates}")
+        if self.xhs_client.circuit_breaker:
+            utils.logger.info(f"[XiaoHongShuCrawler.log_metrics] circuit breaker opened "
+                              f"{self.xhs_client.circuit_breaker.open_count} times")
+        errors = ", ".join(f"{error_type}={count}" for error_type, count in self.xhs_client.error_counter.items())
+        utils.logger.info(f"[XiaoHongShuCrawler.log_metrics] request errors: {errors or 'none'}")
+
+    async def save_sign_state(self) -> None:
+        """保存浏览器中的登录态(cookies、localStorage 中的 b1 和 User-Agent)，供无浏览器签名模式使用"""
+        sign_state = {
+            "cookies": await self.browser_context.cookies(),
+            "user_agent": self.user_agent,
+            "local_storage": {
+                "b1": await self.context_page.evaluate("() => window.localStorage.getItem('b1')") or ""
+            }
+        }
+        pathlib.Path(config.XHS_SIGN_STATE_PATH).parent.mkdir(parents=True, exist_ok=True)
+        with open(config.XHS_SIGN_STATE_PATH, "w", encoding="utf-8") as f:
+            json.dump(sign_state, f, ensure_ascii=False)
+
+    @staticmethod
+    def load_sign_state() -> Dict:
+        if not os.path.exists(config.XHS_SIGN_STATE_PATH):
+            return {}
+        with open(config.XHS_SIGN_STATE_PATH, encoding="utf-8") as f:
+            return json.load(f)
 
     @staticmethod
     def format_proxy_info(ip_proxy_info: IpInfoModel) -> Tuple[Optional[Dict], Optional[Dict]]:
@@ -113,8 +248,17 @@ class XiaoHongShuCrawler(AbstractCrawler):
             )
             return browser_context
 
-    async def create_xhs_client(self, httpx_proxy: Optional[str]) -> XHSClient:
-        cookie_str, cookie_dict = utils.convert_cookies()
+    async def new_sign_page(self) -> Page:
+        """创建一个打开小红书首页的签名页面"""
+        sign_page = await self.browser_context.new_page()
+        await sign_page.goto(self.index_url)
+        return sign_page
+
+    async def create_xhs_client(self, httpx_proxy: Optional[Dict], signer: AbstractSigner,
+                                cookies: Optional[List[Dict]] = None) -> XHSClient:
+        if cookies is None:
+            cookies = await self.browser_context.cookies()
+        cookie_str, cookie_dict = utils.convert_cookies(cookies)
         xhs_client_obj = XHSClient(
             proxies=httpx_proxy,
             headers={
@@ -124,58 +268,377 @@ class XiaoHongShuCrawler(AbstractCrawler):
                 "Referer": "https://www.xiaohongshu.com",
                 "Content-Type": "application/json;charset=UTF-8"
             },
-            playwright_page=self.context_page,
+            playwright_page=getattr(self, "context_page", None),
             cookie_dict=cookie_dict,
+            signer=signer,
+            rate_limiter=RateLimiter(
+                rate=config.RATE_LIMIT_INIT_RATE,
+                min_rate=config.RATE_LIMIT_MIN_RATE,
+                max_rate=config.RATE_LIMIT_MAX_RATE,
+                increase_step=config.RATE_LIMIT_INCREASE_STEP,
+                decrease_factor=config.RATE_LIMIT_DECREASE_FACTOR
+            ) if config.ENABLE_RATE_LIMIT else None,
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=config.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                window=config.CIRCUIT_BREAKER_WINDOW,
+                recovery_timeout=config.CIRCUIT_BREAKER_RECOVERY_TIMEOUT
+            ),
+            max_retries=config.XHS_REQUEST_MAX_RETRIES,
+            http2=config.ENABLE_HTTP2,
+            limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+            )
         )
         return xhs_client_obj
 
     async def search(self) -> None:
+        """
+        流水线方式搜索：搜索翻页 -> 笔记详情 -> 存储 -> 评论，各阶段之间通过有界队列连接
+        所有关键词同时翻页，第N页笔记的评论和第N+1页(以及其他关键词)的笔记详情可以同时进行，
+        所有阶段的网络请求共用一个全局并发数，队列满时上游阶段会被阻塞，内存占用有上限
+        :return:
+        """
+        self.crawl_semaphore = asyncio.Semaphore(config.MAX_CONCURRENCY_NUM)
+        self.seen_note_filter = SeenFilter(
+            store_dir=config.SEEN_NOTE_FILTER_DIR,
+            name="xhs_notes",
+            ttl_days=config.SEEN_NOTE_TTL_DAYS,
+            capacity=config.SEEN_NOTE_FILTER_CAPACITY,
+            error_rate=config.SEEN_NOTE_FILTER_ERROR_RATE
+        ) if config.ENABLE_SEEN_NOTE_FILTER else None
+        self.crawled_note_ids: Set[str] = set()
+        # 按最新排序搜索时使用水位线，翻页越过上一次运行爬到的最新笔记时间后停止翻页
+        self.search_sort_type = SearchSortType(config.SORT_TYPE) if config.SORT_TYPE != '' else SearchSortType.GENERAL
+        self.search_watermark = SearchWatermark(config.SEARCH_WATERMARK_PATH) if (
+                config.ENABLE_SEARCH_WATERMARK and self.search_sort_type == SearchSortType.LATEST) else None
+        self.watermark_crossed_keywords: Set[str] = set()
+        # 爬取进度日志，--resume 时从上一次中断的位置继续：未完成的笔记重新入队，翻页和评论游标接着上一次的位置
+        self.checkpoint = CrawlCheckpoint(config.CRAWL_CHECKPOINT_PATH) if config.ENABLE_CRAWL_CHECKPOINT else None
+        if self.checkpoint:
+            self.checkpoint.open(resume=self.resume)
+        # 上一次中断时没有爬取完成的笔记，只有这些笔记不经过历史去重
+        self.resume_note_ids = {
+            note_id for keyword in self.checkpoint.keyword_notes for note_id in self.checkpoint.pending_notes(keyword)
+        } if self.checkpoint and self.resume else set()
+        crawl_finished = False
+        note_queue: asyncio.Queue = asyncio.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+        store_queue: asyncio.Queue = asyncio.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+        comment_queue: asyncio.Queue = asyncio.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+
+        async def run_stages():
+            await asyncio.gather(*[
+                self.search_keyword(keyword, note_queue) for keyword in config.KEYWORDS.split(",")
+            ])
+            await note_queue.join()
+            await store_queue.join()
+            await comment_queue.join()
+
+        workers: List[Task] = []
+        for _ in range(config.MAX_CONCURRENCY_NUM):
+            workers.append(asyncio.create_task(self.note_detail_worker(note_queue, store_queue)))
+            workers.append(asyncio.create_task(self.note_comment_worker(comment_queue)))
+        workers.append(asyncio.create_task(self.note_store_worker(store_queue, comment_queue)))
+        stages_task = asyncio.create_task(run_stages())
+        try:
+            # worker 是常驻任务，只有出现异常(例如登录态失效)才会提前结束，此时终止整条流水线
+            done, _ = await asyncio.wait([stages_task, *workers], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+            # 只在完整爬取结束后保存水位线，中途失败时下一次运行仍然从上一次的水位线开始
+            if self.search_watermark:
+                self.search_watermark.save()
+            crawl_finished = True
+        finally:
+            for task in [stages_task, *workers]:
+                task.cancel()
+            await asyncio.gather(stages_task, *workers, return_exceptions=True)
+            if self.seen_note_filter:
+                self.seen_note_filter.save()
+            if self.checkpoint:
+                # 有失败的关键词或笔记时保留进度日志，可以用 --resume 继续
+                self.checkpoint.close(finished=crawl_finished
+                                      and not self.checkpoint.has_pending(config.KEYWORDS.split(",")))
+
+    async def search_keyword(self, keyword: str, note_queue: asyncio.Queue) -> None:
+        """搜索阶段：按关键词翻页，把笔记ID放入笔记详情队列"""
         xhs_limit_count = 20
-        for keyword in config.KEYWORDS.split(","):
-            page = 1
-            while page * xhs_limit_count <= config.CRAWLER_MAX_NOTES_COUNT:
-                note_id_list: List[str] = []
-                notes_res = await self.xhs_client.get_note_by_keyword(
-                    keyword=keyword,
-                    page=page,
-                    sort=SearchSortType(config.SORT_TYPE) if config.SORT_TYPE != '' else SearchSortType.GENERAL
-                )
-                semaphore = asyncio.Semaphore(config.MAX_CONCURRENCY_NUM)
-                task_list = [
-                    self.get_note_detail(post_item.get('id'), semaphore)
-                    for post_item in notes_res.get("items", {})
-                    if post_item.get('model_type') not in ('rec_query', 'hot_query')
-                ]
-                mote_details = await asyncio.gather(*task_list)
-                for note_detail in mote_details:
-                    if note_detail is not None:
-                        await xhs_store.update_xhs_note(note_detail)
-                        note_id_list.append(note_detail.get("note_id"))
-                page += 1
-                await self.batch_get_note_comments(note_id_list)
+        page = 1
+        if self.checkpoint:
+            for note_id in self.checkpoint.pending_notes(keyword):
+                await note_queue.put((keyword, note_id))
+            if keyword in self.checkpoint.finished_keywords:
+                return
+            page = self.checkpoint.keyword_pages.get(keyword, 0) + 1
+        while page * xhs_limit_count <= config.CRAWLER_MAX_NOTES_COUNT:
+            if keyword in self.watermark_crossed_keywords:
+                utils.logger.info(f"[XiaoHongShuCrawler.search_keyword] {keyword} reached the watermark, stop paging")
+                break
+            try:
+                async with self.crawl_semaphore:
+                    notes_res = await self.xhs_client.get_note_by_keyword(
+                        keyword=keyword,
+                        page=page,
+                        sort=self.search_sort_type
+                    )
+            except LoginExpiredError:
+                raise
+            except XHSRequestError as ex:
+                utils.logger.error(f"[XiaoHongShuCrawler.search_keyword] search {keyword} page {page} error: {ex!r}")
+                # 翻页失败的关键词不记录完成，恢复时从失败的这一页继续
+                return
+            note_ids = [post_item.get("id") for post_item in notes_res.get("items", [])
+                        if post_item.get('model_type') not in ('rec_query', 'hot_query')]
+            if self.checkpoint:
+                self.checkpoint.record_page(keyword, page, note_ids)
+            for note_id in note_ids:
+                await note_queue.put((keyword, note_id))
+            if not notes_res.get("has_more", True):
+                break
+            page += 1
+        if self.checkpoint:
+            self.checkpoint.record_keyword_finished(keyword)
+
+    async def note_detail_worker(self, note_queue: asyncio.Queue, store_queue: asyncio.Queue) -> None:
+        """笔记详情阶段"""
+        while True:
+            keyword, note_id = await note_queue.get()
+            try:
+                await self.process_note(keyword, note_id, store_queue)
+            finally:
+                note_queue.task_done()
+
+    async def process_note(self, keyword: str, note_id: str, store_queue: asyncio.Queue) -> None:
+        """
+        获取笔记详情并放入存储队列，没有进入下一阶段的笔记在这里结束，详情获取失败的笔记不结束，恢复时重新爬取
+        笔记在请求详情之前就标记为本次运行已接手，多个关键词搜到同一笔记时只请求一次详情
+        """
+        if note_id in self.crawled_note_ids:
+            # 本次运行中其他任务已经接手该笔记，由该任务结束
+            return
+        # 恢复的笔记上一次已经标记过，但没有爬取完成，不经过历史去重
+        # 有水位线的关键词也不经过历史去重，否则重复运行时历史笔记都被跳过，拿不到发布时间，永远越不过水位线
+        ignore_history = self.is_note_resumed(note_id) or self.has_search_watermark(keyword)
+        if keyword in self.watermark_crossed_keywords or self.is_note_crawled(note_id, ignore_history):
+            self.finish_note(note_id, crawled=False)
+            return
+        self.mark_note_crawled(note_id)
+        note_detail = await self.get_note_detail(note_id, self.crawl_semaphore)
+        if not note_detail:
+            return
+        if self.search_watermark and self.search_watermark.is_crossed(keyword, note_detail.get("time", 0)):
+            self.watermark_crossed_keywords.add(keyword)
+            self.finish_note(note_id, crawled=False)
+            return
+        await store_queue.put((keyword, note_detail))
+
+    async def note_store_worker(self, store_queue: asyncio.Queue, comment_queue: asyncio.Queue) -> None:
+        """存储阶段"""
+        while True:
+            keyword, note_detail = await store_queue.get()
+            try:
+                if not await self.store_note(keyword, note_detail, comment_queue):
+                    self.finish_note(note_detail.get("note_id"))
+            finally:
+                store_queue.task_done()
+
+    async def store_note(self, keyword: str, note_detail: Dict, comment_queue: asyncio.Queue) -> bool:
+        """
+        存储笔记详情，需要爬取评论时放入评论队列
+        :return: 笔记进入了下一阶段返回 True
+        """
+        note_id = note_detail.get("note_id")
+        if self.search_watermark:
+            self.search_watermark.update(keyword, note_detail.get("time", 0))
+        stored_state = await xhs_store.get_xhs_note_state(note_id) if config.ENABLE_INCREMENTAL_CRAWL else None
+        if stored_state and not self.is_note_changed(note_detail, stored_state):
+            # 增量模式下笔记没有更新，评论数也没有变化，跳过存储和评论爬取
+            return False
+        await xhs_store.update_xhs_note(note_detail)
+        if not config.ENABLE_GET_COMMENTS:
+            return False
+        cursor = self.checkpoint.comment_cursors.get(note_id, "") if self.checkpoint else ""
+        await comment_queue.put((note_id, stored_state is not None, cursor))
+        return True
+
+    async def note_comment_worker(self, comment_queue: asyncio.Queue) -> None:
+        """评论阶段"""
+        while True:
+            note_id, incremental, cursor = await comment_queue.get()
+            try:
+                # 评论没有爬取完整的笔记不结束：不记录到历史去重，进度日志中仍然是未完成，恢复时从评论和回复的游标继续
+                if await self.get_comments(note_id, self.crawl_semaphore, incremental=incremental, cursor=cursor):
+                    self.finish_note(note_id)
+            finally:
+                comment_queue.task_done()
+
+    @staticmethod
+    def is_note_changed(note_detail: Dict, stored_state: Dict) -> bool:
+        """对比笔记详情和已存储的笔记，最后更新时间或评论数有变化才需要重新爬取"""
+        interact_info: Dict = note_detail.get("interact_info", {})
+        return (str(note_detail.get("last_update_time", 0)) != str(stored_state.get("last_update_time"))
+                or str(interact_info.get("comment_count")) != str(stored_state.get("comment_count")))
+
+    def is_note_crawled(self, note_id: str, ignore_history: bool = False) -> bool:
+        """
+        笔记在本次运行中已经爬取过，或者在过期时间内的历史运行中爬取过
+        :param note_id:
+        :param ignore_history: 只检查本次运行，忽略历史运行的记录
+        :return:
+        """
+        if note_id in self.crawled_note_ids:
+            return True
+        return not ignore_history and self.seen_note_filter is not None and note_id in self.seen_note_filter
+
+    def mark_note_crawled(self, note_id: str) -> None:
+        """标记笔记在本次运行中已经接手，同一笔记只由一个任务处理，爬取完成后才在 finish_note 中记录到历史去重"""
+        self.crawled_note_ids.add(note_id)
+
+    def has_search_watermark(self, keyword: str) -> bool:
+        """关键词有上一次运行的水位线，由水位线判断笔记是否已经爬取过"""
+        return self.search_watermark is not None and self.search_watermark.get(keyword) is not None
+
+    def is_note_resumed(self, note_id: str) -> bool:
+        """笔记是从进度日志中恢复的未完成笔记"""
+        return note_id in self.resume_note_ids
+
+    def finish_note(self, note_id: str, crawled: bool = True) -> None:
+        """
+        笔记所有阶段处理结束，记录到进度日志
+        :param note_id:
+        :param crawled: 笔记详情和评论已经爬取完成，记录到历史去重，为 False 时表示笔记被跳过
+        :return:
+        """
+        if self.checkpoint:
+            self.checkpoint.record_note_finished(note_id)
+        if crawled and self.seen_note_filter:
+            self.seen_note_filter.add(note_id)
 
     async def get_note_detail(self, note_id: str, semaphore: asyncio.Semaphore) -> Optional[Dict]:
         """get note detail"""
         async with semaphore:
             try:
                 return await self.xhs_client.get_note_by_id(note_id)
+            except LoginExpiredError:
+                raise
+            except XHSRequestError as ex:
+                utils.logger.error(f"[XiaoHongShuCrawler.get_note_detail] get note {note_id} detail error: {ex!r}")
+                return None
             except KeyError as ex:
                 return None
 
-    async def batch_get_note_comments(self, note_list: List[str]):
-        if not config.ENABLE_GET_COMMENTS:
-            return
-        semaphore = asyncio.Semaphore(config.MAX_CONCURRENCY_NUM)
-        task_list: List[Task] = []
-        for note_id in note_list:
-            task = asyncio.create_task(self.get_comments(note_id, semaphore), name=note_id)
-            task_list.append(task)
-        await asyncio.gather(*task_list)
-
-    async def get_comments(self, note_id: str, semaphore: asyncio.Semaphore):
-        async with semaphore:
-            await self.xhs_client.get_note_all_comments(
-                note_id=note_id,
-                crawl_interval=random.random(),
-                callback=xhs_store.batch_update_xhs_note_comments
-            )
+    async def get_comments(self, note_id: str, semaphore: asyncio.Semaphore, incremental: bool = False,
+                           cursor: str = "") -> bool:
+        """
+        逐页获取笔记评论并存储，每一页评论请求单独占用一个并发名额，不会在内存中累积整个评论串
+        开启二级评论爬取时，有回复的一级评论会并发地爬取回复，和一级评论翻页共用同一个并发名额
+        增量模式下只存储新评论，并且可以在遇到第一条已存储的评论时停止翻页
+        已存储的一级评论下可能有新回复，是否爬取回复只看评论的回复数，和评论是否已存储无关
+        每一页评论存储后把下一页的游标记录到进度日志，恢复时从 cursor 继续翻页，没有爬完回复的一级评论从回复游标继续
+        :return: 评论和回复全部爬取成功返回 True
+        """
+        sub_comment_tasks: Set[Task] = set()
+        succeeded = True
+        # 上一次中断时还没有爬完回复的一级评论
+        pending_sub_cursors = dict(self.checkpoint.sub_comment_cursors.get(note_id, {})) if self.checkpoint else {}
+        try:
+            for root_comment_id, sub_cursor in pending_sub_cursors.items():
+                sub_comment_tasks, done_succeeded = await self.wait_tasks(sub_comment_tasks)
+                succeeded = done_succeeded and succeeded
+                root_comment = {"id": root_comment_id, "sub_comment_cursor": sub_cursor, "sub_comment_has_more": True}
+                sub_comment_tasks.add(asyncio.create_task(
+                    self.get_sub_comments(note_id, root_comment, semaphore, incremental=incremental)))
+            async for comments_page in self.xhs_client.iter_note_comments(
+                    note_id=note_id,
+                    cursor=cursor,
+                    crawl_interval=0 if config.ENABLE_RATE_LIMIT else random.random(),
+                    max_pages=config.CRAWLER_MAX_COMMENT_PAGES_PER_NOTE or None,
+                    max_comments=config.CRAWLER_MAX_COMMENTS_PER_NOTE or None,
+                    semaphore=semaphore
+            ):
+                comments = comments_page["comments"]
+                new_comments, reached_stored_comment = await self.filter_new_comments(comments, incremental)
+                await xhs_store.batch_update_xhs_note_comments(note_id, new_comments)
+                for comment in comments:
+                    if (not config.ENABLE_GET_SUB_COMMENTS or int(comment.get("sub_comment_count") or 0) <= 0
+                            or comment.get("id") in pending_sub_cursors):
+                        continue
+                    sub_comment_tasks, done_succeeded = await self.wait_tasks(sub_comment_tasks)
+                    succeeded = done_succeeded and succeeded
+                    # 在记录评论游标之前记录这条评论的回复还没有爬取，中断后恢复时不会漏掉
+                    if self.checkpoint:
+                        self.checkpoint.record_sub_comment_cursor(note_id, comment.get("id"), "")
+                    sub_comment_tasks.add(asyncio.create_task(
+                        self.get_sub_comments(note_id, comment, semaphore, incremental=incremental)))
+                if self.checkpoint and comments_page["has_more"]:
+                    self.checkpoint.record_comment_cursor(note_id, comments_page["cursor"])
+                if reached_stored_comment and config.INCREMENTAL_STOP_AT_STORED_COMMENT:
+                    break
+            if sub_comment_tasks:
+                succeeded = all(await asyncio.gather(*sub_comment_tasks)) and succeeded
+            return succeeded
+        except LoginExpiredError:
+            raise
+        except XHSRequestError as ex:
+            utils.logger.error(f"[XiaoHongShuCrawler.get_comments] get note {note_id} comments error: {ex!r}")
+            return False
+        finally:
+            for task in sub_comment_tasks:
+                task.cancel()
+
+    @staticmethod
+    async def wait_tasks(tasks: Set[Task]) -> Tuple[Set[Task], bool]:
+        """
+        限制单个笔记同时进行的回复爬取任务数量，避免评论很多时任务无限堆积
+        :param tasks: 正在进行的任务
+        :return: 仍在进行的任务，以及等待期间结束的任务是否全部成功
+        """
+        succeeded = True
+        while len(tasks) >= config.MAX_CONCURRENCY_NUM * 2:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            succeeded = all([task.result() for task in done]) and succeeded
+        return tasks, succeeded
+
+    @staticmethod
+    async def filter_new_comments(comments: List[Dict], incremental: bool) -> Tuple[List[Dict], bool]:
+        """
+        增量模式下过滤掉已经存储的评论
+        :param comments:
+        :param incremental:
+        :return: 需要存储的评论，以及这一页中是否有已存储的评论
+        """
+        if not incremental:
+            return comments, False
+        stored_comment_ids = await xhs_store.get_stored_xhs_comment_ids([c.get("id") for c in comments])
+        new_comments = [c for c in comments if c.get("id") not in stored_comment_ids]
+        return new_comments, len(new_comments) < len(comments)
+
+    async def get_sub_comments(self, note_id: str, root_comment: Dict, semaphore: asyncio.Semaphore,
+                               incremental: bool = False) -> bool:
+        """
+        逐页获取一条一级评论下的回复并存储，增量模式下只存储新回复
+        :return: 回复全部爬取成功返回 True
+        """
+        root_comment_id = root_comment.get("id")
+        try:
+            async for sub_comments_page in self.xhs_client.iter_note_sub_comments(
+                    note_id=note_id,
+                    root_comment=root_comment,
+                    crawl_interval=0 if config.ENABLE_RATE_LIMIT else random.random(),
+                    semaphore=semaphore
+            ):
+                sub_comments, _ = await self.filter_new_comments(sub_comments_page["comments"], incremental)
+                await xhs_store.batch_update_xhs_note_comments(note_id, sub_comments,
+                                                               parent_comment_id=root_comment_id)
+                if self.checkpoint and sub_comments_page["has_more"]:
+                    self.checkpoint.record_sub_comment_cursor(note_id, root_comment_id, sub_comments_page["cursor"])
+            if self.checkpoint:
+                self.checkpoint.record_sub_comments_finished(note_id, root_comment_id)
+            return True
+        except LoginExpiredError:
+            raise
+        except XHSRequestError as ex:
+            utils.logger.error(f"[XiaoHongShuCrawler.get_sub_comments] get comment {root_comment_id} "
+                               f"sub comments error: {ex!r}")
+            return False
@@ -0,0 +1,37 @@
+class XHSRequestError(Exception):
+    """小红书接口请求异常基类，retriable 表示该类错误是否值得重试"""
+    error_type = "unknown"
+    retriable = False
+
+
+class NetworkError(XHSRequestError):
+    """网络异常：连接失败、超时、服务端5xx"""
+    error_type = "network"
+    retriable = True
+
+
+class IPBlockError(XHSRequestError):
+    """请求过快，IP被限制访问(300012、HTTP 429/461)"""
+    error_type = "ip_blocked"
+    retriable = True
+
+
+class SignatureExpiredError(XHSRequestError):
+    """请求签名失效，需要重新签名"""
+    error_type = "signature_expired"
+    retriable = True
+
+
+class NoteAbnormalError(XHSRequestError):
+    """笔记状态异常，笔记已删除或不可见"""
+    error_type = "note_abnormal"
+
+
+class LoginExpiredError(XHSRequestError):
+    """登录态失效，需要重新登录"""
+    error_type = "login_expired"
+
+
+class DataFetchError(XHSRequestError):
+    """其他接口返回的业务错误"""
+    error_type = "data_fetch"
@@ -0,0 +1,115 @@
+import asyncio
+import hmac
+import json
+from typing import Dict, Optional, Tuple
+
+from playwright.async_api import async_playwright
+
+import config
+from tools import utils
+from .core import XiaoHongShuCrawler
+from .signer import XHSSignerPool
+
+
+class XHSSignServer:
+    """
+    本地签名服务，常驻一个已登录并预热好的浏览器，为同一台机器上的多个爬虫进程提供签名
+    POST /sign     请求体 {"uri": "...", "data": {...}}，返回签名请求头
+    GET  /cookies  返回浏览器当前的 cookies 和 User-Agent，爬虫进程需要使用同一份登录态
+    GET  /metrics  返回各个签名页面的负载和排队等待时间
+    配置了访问令牌时所有接口都需要 Authorization: Bearer <令牌> 请求头，没有配置令牌时不提供 /cookies 接口
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8989, login_type: str = config.LOGIN_TYPE,
+                 token: str = config.XHS_SIGN_SERVER_TOKEN):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.crawler = XiaoHongShuCrawler()
+        self.crawler.init_config(platform="xhs", login_type=login_type, crawler_type="")
+        self.signer_pool: Optional[XHSSignerPool] = None
+
+    async def start(self) -> None:
+        async with async_playwright() as playwright:
+            await self.crawler.open_browser(playwright)
+            _, cookie_dict = utils.convert_cookies(await self.crawler.browser_context.cookies())
+            self.signer_pool = await XHSSignerPool.create(
+                page_factory=self.crawler.new_sign_page,
+                cookie_dict=cookie_dict,
+                pool_size=config.XHS_SIGN_PAGE_COUNT,
+                first_page=self.crawler.context_page,
+                health_check_interval=config.XHS_SIGN_HEALTH_CHECK_INTERVAL
+            )
+            self.crawler.xhs_client = await self.crawler.create_xhs_client(None, self.signer_pool)
+            async with self.crawler.xhs_client:
+                try:
+                    if not await self.crawler.xhs_client.pong():
+                        await self.crawler.login()
+                    await self.crawler.save_sign_state()
+                    server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+                    async with server:
+                        await server.serve_forever()
+                finally:
+                    await self.signer_pool.close()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个长连接上的多个 HTTP/1.1 请求"""
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if self.token and not hmac.compare_digest(headers.get("authorization", ""), f"Bearer {self.token}"):
+                    status, response = "401 Unauthorized", {"error": "invalid token"}
+                else:
+                    status, response = await self.dispatch(method, path, body)
+                payload = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: application/json;charset=UTF-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """
+        读取一个请求
+        :return: 请求方法, 路径, 请求头(名称小写), 请求体
+        """
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers: Dict[str, str] = {}
+        while True:
+            header_line = await reader.readline()
+            if header_line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header_line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        content_length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(content_length) if content_length else b""
+        return method.upper(), path, headers, body
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> Tuple[str, Dict]:
+        try:
+            if method == "POST" and path == "/sign":
+                sign_request: Dict = json.loads(body or b"{}")
+                return "200 OK", await self.signer_pool.sign(sign_request.get("uri", ""), sign_request.get("data"))
+            if method == "GET" and path == "/cookies":
+                if not self.token:
+                    return "403 Forbidden", {"error": "set XHS_SIGN_SERVER_TOKEN to share the login state"}
+                cookies = await self.crawler.browser_context.cookies()
+                return "200 OK", {"cookies": cookies, "user_agent": self.crawler.user_agent}
+            if method == "GET" and path == "/metrics":
+                return "200 OK", {"pages": self.signer_pool.metrics()}
+            return "404 Not Found", {"error": f"unknown route {method} {path}"}
+        except Exception as e:
+            return "500 Internal Server Error", {"error": str(e)}
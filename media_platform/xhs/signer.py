@@ -0,0 +1,366 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from playwright.async_api import Page
+
+from base.base_crawler import AbstractSigner
+from .exception import DataFetchError, NetworkError
+from .help import sign
+
+
+class XHSPageSigner(AbstractSigner):
+    """
+    基于playwright页面的请求签名器
+    1. localStorage 中的 b1 只在 cookies 更新后才重新读取, 不再每次请求都序列化整个 localStorage
+    2. 同一时刻等待签名的多个请求合并到一次 page.evaluate 中完成签名
+    3. 每个请求拿到的都是自己独立的请求头, 不再修改共享的 headers
+    """
+    _batch_sign_js = """([items, needB1]) => ({
+        signs: items.map(([url, data]) => window._webmsxyw(url, data)),
+        b1: needB1 ? window.localStorage.getItem("b1") : null
+    })"""
+
+    def __init__(self, playwright_page: Page, cookie_dict: Dict[str, str]):
+        self.playwright_page = playwright_page
+        self.cookie_dict = cookie_dict
+        self._b1: Optional[str] = None
+        self._pending: List[Tuple[str, Optional[Dict], asyncio.Future, float]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._in_flight = 0
+        # 签名排队等待时间统计, 单位秒
+        self.sign_count = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    async def sign(self, uri: str, data: Optional[Dict] = None) -> Dict[str, str]:
+        """
+        对请求签名，返回签名相关的请求头
+        :param uri: 请求路由(GET请求需带上查询参数)
+        :param data: POST请求体
+        :return:
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((uri, data, future, time.monotonic()))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+        return await future
+
+    async def update_cookies(self, cookie_dict: Dict[str, str]):
+        """cookies 更新后 b1 可能发生变化，需要在下一次签名时重新读取"""
+        self.cookie_dict = cookie_dict
+        self._b1 = None
+
+    async def replace_page(self, playwright_page: Page):
+        """页面崩溃重建后替换签名页面，新页面需要重新读取 b1"""
+        self.playwright_page = playwright_page
+        self._b1 = None
+
+    @property
+    def load(self) -> int:
+        """等待签名和正在签名的请求数量"""
+        return len(self._pending) + self._in_flight
+
+    def metrics(self) -> Dict:
+        return {
+            "load": self.load,
+            "sign_count": self.sign_count,
+            "avg_wait_time": self.total_wait_time / self.sign_count if self.sign_count else 0.0,
+            "max_wait_time": self.max_wait_time,
+        }
+
+    async def _flush(self) -> None:
+        """
+        批量签名，evaluate 期间新进入的请求会在下一轮一起签名
+        :return:
+        """
+        try:
+            # 让出一次事件循环，使同一批被调度的协程都能进入等待队列
+            await asyncio.sleep(0)
+            while self._pending:
+                batch, self._pending = self._pending, []
+                self._record_wait_time(batch)
+                self._in_flight = len(batch)
+                try:
+                    result = await self.playwright_page.evaluate(
+                        self._batch_sign_js,
+                        [[[uri, data] for uri, data, _, _ in batch], self._b1 is None]
+                    )
+                except Exception as e:
+                    for _, _, future, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                finally:
+                    self._in_flight = 0
+                if self._b1 is None:
+                    self._b1 = result.get("b1") or ""
+                for (_, _, future, _), encrypt_params in zip(batch, result.get("signs", [])):
+                    if not future.done():
+                        future.set_result(self._make_headers(encrypt_params))
+        finally:
+            self._flush_task = None
+
+    def _record_wait_time(self, batch: List[Tuple[str, Optional[Dict], asyncio.Future, float]]) -> None:
+        now = time.monotonic()
+        for *_, enqueue_time in batch:
+            wait_time = now - enqueue_time
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+        self.sign_count += len(batch)
+
+    def _make_headers(self, encrypt_params: Dict) -> Dict[str, str]:
+        signs = sign(
+            a1=self.cookie_dict.get("a1", ""),
+            b1=self._b1 or "",
+            x_s=encrypt_params.get("X-s", ""),
+            x_t=str(encrypt_params.get("X-t", ""))
+        )
+        return {
+            "X-S": signs["x-s"],
+            "X-T": signs["x-t"],
+            "x-S-Common": signs["x-s-common"],
+            "X-B3-Traceid": signs["x-b3-traceid"]
+        }
+
+
+class XHSSignerPool(AbstractSigner):
+    """
+    多页面签名池，同一个浏览器上下文中开启多个签名页面，签名吞吐量随页面数量提升
+    1. 每次签名分发给当前负载最小的页面
+    2. 定时健康检查，页面崩溃或签名函数丢失时自动重建页面
+    """
+    _health_check_js = "() => typeof window._webmsxyw === 'function'"
+
+    def __init__(self, page_factory: Callable[[], Awaitable[Page]], cookie_dict: Dict[str, str],
+                 health_check_interval: float = 30):
+        self.page_factory = page_factory
+        self.cookie_dict = cookie_dict
+        self.health_check_interval = health_check_interval
+        self.signers: List[XHSPageSigner] = []
+        self._recreating: Dict[int, asyncio.Task] = {}
+        self._health_check_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def create(cls, page_factory: Callable[[], Awaitable[Page]], cookie_dict: Dict[str, str],
+                     pool_size: int = 1, first_page: Optional[Page] = None,
+                     health_check_interval: float = 30) -> "XHSSignerPool":
+        """
+        创建签名池
+        :param page_factory: 创建一个已打开小红书首页的页面
+        :param cookie_dict:
+        :param pool_size: 签名页面数量
+        :param first_page: 复用已经打开的页面作为第一个签名页面
+        :param health_check_interval: 健康检查间隔(秒)
+        :return:
+        """
+        pool = cls(page_factory, cookie_dict, health_check_interval)
+        pages = [first_page] if first_page else []
+        pages += await asyncio.gather(*[page_factory() for _ in range(max(pool_size, 1) - len(pages))])
+        pool.signers = [XHSPageSigner(page, cookie_dict) for page in pages]
+        pool._health_check_task = asyncio.create_task(pool._health_check_loop())
+        return pool
+
+    async def sign(self, uri: str, data: Optional[Dict] = None) -> Dict[str, str]:
+        index = self._least_busy_index()
+        try:
+            return await self.signers[index].sign(uri, data)
+        except Exception:
+            # 签名失败大概率是页面崩溃了，重建该页面并换一个页面重试一次
+            self._schedule_recreate(index)
+            return await self.signers[self._least_busy_index(exclude=index)].sign(uri, data)
+
+    async def update_cookies(self, cookie_dict: Dict[str, str]):
+        self.cookie_dict = cookie_dict
+        for signer in self.signers:
+            await signer.update_cookies(cookie_dict)
+
+    def metrics(self) -> List[Dict]:
+        """每个签名页面的负载和排队等待时间"""
+        return [signer.metrics() for signer in self.signers]
+
+    async def close(self) -> None:
+        if self._health_check_task:
+            self._health_check_task.cancel()
+            self._health_check_task = None
+        for task in self._recreating.values():
+            task.cancel()
+        self._recreating.clear()
+
+    def _least_busy_index(self, exclude: Optional[int] = None) -> int:
+        candidates = [i for i in range(len(self.signers)) if i not in self._recreating and i != exclude]
+        if not candidates:
+            candidates = list(range(len(self.signers)))
+        return min(candidates, key=lambda i: self.signers[i].load)
+
+    async def _is_healthy(self, signer: XHSPageSigner) -> bool:
+        if signer.playwright_page.is_closed():
+            return False
+        try:
+            return bool(await asyncio.wait_for(signer.playwright_page.evaluate(self._health_check_js), timeout=10))
+        except Exception:
+            return False
+
+    async def _health_check_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for index, signer in enumerate(self.signers):
+                if index not in self._recreating and not await self._is_healthy(signer):
+                    self._schedule_recreate(index)
+
+    def _schedule_recreate(self, index: int) -> None:
+        if index in self._recreating:
+            return
+        self._recreating[index] = asyncio.create_task(self._recreate_page(index))
+
+    async def _recreate_page(self, index: int) -> None:
+        signer = self.signers[index]
+        try:
+            old_page = signer.playwright_page
+            await signer.replace_page(await self.page_factory())
+            if not old_page.is_closed():
+                await old_page.close()
+        except Exception:
+            # 重建失败，等待下一次健康检查再重试
+            pass
+        finally:
+            self._recreating.pop(index, None)
+
+
+class XHSJsEngineSigner(AbstractSigner):
+    """
+    无浏览器签名器，在进程内的 QuickJS 引擎中执行签名脚本 (需要安装 quickjs: pip install quickjs)
+    签名脚本需要定义 window._webmsxyw(url, data)，cookies 和 localStorage 的值会在脚本执行前注入
+    """
+    _env_js = """
+        var window = globalThis;
+        var self = globalThis;
+        var __local_storage = {};
+        window.localStorage = {
+            getItem: function (key) { return key in __local_storage ? __local_storage[key] : null; },
+            setItem: function (key, value) { __local_storage[key] = String(value); },
+            removeItem: function (key) { delete __local_storage[key]; }
+        };
+        window.document = {cookie: ""};
+        window.navigator = {userAgent: ""};
+        window.location = {href: "https://www.xiaohongshu.com/", host: "www.xiaohongshu.com"};
+    """
+
+    def __init__(self, script_path: str, cookie_dict: Dict[str, str], local_storage: Optional[Dict[str, str]] = None,
+                 user_agent: str = ""):
+        self.script_path = script_path
+        self.cookie_dict = cookie_dict
+        self.local_storage = dict(local_storage or {})
+        self.user_agent = user_agent
+        # QuickJS 上下文不是线程安全的，所有的 JS 调用都放在同一个线程中串行执行
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="xhs_js_signer")
+        self._context = None
+
+    async def sign(self, uri: str, data: Optional[Dict] = None) -> Dict[str, str]:
+        encrypt_params = await self._run_in_engine(self._sign_in_engine, uri, data)
+        signs = sign(
+            a1=self.cookie_dict.get("a1", ""),
+            b1=self.local_storage.get("b1", ""),
+            x_s=encrypt_params.get("X-s", ""),
+            x_t=str(encrypt_params.get("X-t", ""))
+        )
+        return {
+            "X-S": signs["x-s"],
+            "X-T": signs["x-t"],
+            "x-S-Common": signs["x-s-common"],
+            "X-B3-Traceid": signs["x-b3-traceid"]
+        }
+
+    async def update_cookies(self, cookie_dict: Dict[str, str]):
+        self.cookie_dict = cookie_dict
+        await self._run_in_engine(self._inject_state)
+
+    async def update_local_storage(self, local_storage: Dict[str, str]):
+        self.local_storage.update(local_storage)
+        await self._run_in_engine(self._inject_state)
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    async def _run_in_engine(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _ensure_context(self):
+        if self._context is None:
+            import quickjs
+            context = quickjs.Context()
+            context.eval(self._env_js)
+            self._context = context
+            self._inject_state()
+            with open(self.script_path, encoding="utf-8") as f:
+                context.eval(f.read())
+        return self._context
+
+    def _inject_state(self) -> None:
+        if self._context is None:
+            return
+        cookie_str = "; ".join(f"{key}={value}" for key, value in self.cookie_dict.items())
+        self._context.eval(
+            f"window.document.cookie = {json.dumps(cookie_str)};"
+            f"window.navigator.userAgent = {json.dumps(self.user_agent)};"
+            f"Object.assign(__local_storage, {json.dumps(self.local_storage)});"
+        )
+
+    def _sign_in_engine(self, uri: str, data: Optional[Dict]) -> Dict:
+        context = self._ensure_context()
+        result = context.eval(
+            f"JSON.stringify(window._webmsxyw({json.dumps(uri)}, {json.dumps(data, ensure_ascii=False)}))"
+        )
+        return json.loads(result)
+
+
+class XHSRemoteSigner(AbstractSigner):
+    """
+    使用本地签名服务(sign_server.py)签名，同一台机器上的多个爬虫进程共享一个已预热的浏览器
+    登录态由签名服务维护，爬虫进程通过 fetch_login_state 获取同一份 cookies
+    签名服务的网络异常和5xx转换成可重试的 NetworkError，和小红书接口的请求失败一样退避重试
+    """
+
+    def __init__(self, server_url: str, token: str = "", timeout: float = 10):
+        """
+        :param server_url: 签名服务地址
+        :param token: 签名服务的访问令牌，需要和签名服务配置的一致
+        :param timeout: 请求超时时间(秒)
+        """
+        self.server_url = server_url.rstrip("/")
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._http_client = httpx.AsyncClient(base_url=self.server_url, headers=headers, timeout=timeout)
+
+    async def sign(self, uri: str, data: Optional[Dict] = None) -> Dict[str, str]:
+        return await self._request("POST", "/sign", json={"uri": uri, "data": data})
+
+    async def update_cookies(self, cookie_dict: Dict[str, str]):
+        # 登录态由签名服务维护，a1 以签名服务浏览器中的为准
+        pass
+
+    async def fetch_login_state(self) -> Dict:
+        """
+        获取签名服务浏览器的 cookies 和 User-Agent
+        :return:
+        """
+        return await self._request("GET", "/cookies")
+
+    async def _request(self, method: str, path: str, **kwargs) -> Dict:
+        try:
+            response = await self._http_client.request(method, path, **kwargs)
+        except httpx.TransportError as e:
+            raise NetworkError(f"sign server {type(e).__name__}: {e}") from e
+        if response.status_code >= 500:
+            raise NetworkError(f"sign server http status {response.status_code}: {response.text[:200]}")
+        if response.status_code >= 400:
+            raise DataFetchError(f"sign server http status {response.status_code}: {response.text[:200]}")
+        try:
+            return response.json()
+        except ValueError as e:
+            raise NetworkError("sign server invalid json response") from e
+
+    async def close(self) -> None:
+        await self._http_client.aclose()
@@ -0,0 +1,26 @@
+import argparse
+import asyncio
+from urllib.parse import urlparse
+
+import config
+from media_platform.xhs.sign_server import XHSSignServer
+
+
+async def main():
+    server_url = urlparse(config.XHS_SIGN_SERVER_URL)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default=server_url.hostname, help="Sign server listen host")
+    parser.add_argument("--port", type=int, default=server_url.port, help="Sign server listen port")
+    parser.add_argument("--lt", type=str, choices=['qrcode', 'phone', 'cookie'], default=config.LOGIN_TYPE,
+                        help="Login type (qrcode | phone | cookie)")
+    parser.add_argument("--token", type=str, default=config.XHS_SIGN_SERVER_TOKEN,
+                        help="Shared token required in the Authorization header, /cookies is disabled without it")
+
+    args = parser.parse_args()
+
+    server = XHSSignServer(host=args.host, port=args.port, login_type=args.lt, token=args.token)
+    await server.start()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+# 不参与内容指纹计算的字段: 每次写入都会变化的时间戳和指纹本身
+CONTENT_HASH_EXCLUDE_FIELDS = frozenset(("add_ts", "last_modify_ts", "content_hash"))
+
+
+def make_content_hash(item: Dict, exclude_fields: Iterable[str] = CONTENT_HASH_EXCLUDE_FIELDS) -> str:
+    """
+    计算数据内容的指纹(blake2b 128位)，字段按名称排序后序列化，除排除的字段外内容相同时指纹相同
+    :param item:
+    :param exclude_fields:
+    :return: 32位十六进制字符串
+    """
+    payload = {key: value for key, value in item.items() if key not in exclude_fields}
+    serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(serialized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ContentHashCache:
+    """已写入数据的内容指纹缓存，超过容量时淘汰最久未使用的记录"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._hashes: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        content_hash = self._hashes.get(key)
+        if content_hash is not None:
+            self._hashes.move_to_end(key)
+        return content_hash
+
+    def put(self, key: str, content_hash: Optional[str]):
+        if content_hash is None:
+            return
+        self._hashes[key] = content_hash
+        self._hashes.move_to_end(key)
+        while len(self._hashes) > self.capacity:
+            self._hashes.popitem(last=False)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._hashes
@@ -0,0 +1,75 @@
+import asyncio
+import csv
+import io
+import os
+import pathlib
+from typing import Dict, List, Optional, TextIO
+
+from tools import utils
+
+
+class CsvWriter:
+    """
+    按天写入的 csv 文件: {store_type}_{日期}.csv，文件句柄一直保持打开，每批数据拼接后一次写入
+    列顺序固定，新文件只写一次表头，跨过零点后切换到新日期的文件，文件读写都在线程中完成
+    """
+
+    def __init__(self, store_dir: str, store_type: str, columns: List[str]):
+        """
+        :param store_dir: 存储目录
+        :param store_type: 数据类型，作为文件名前缀
+        :param columns: 列名，按顺序写入，数据中多余的字段忽略，缺少的字段留空
+        """
+        self.store_dir = store_dir
+        self.store_type = store_type
+        self.columns = columns
+        self._lock = asyncio.Lock()
+        self._file: Optional[TextIO] = None
+        self._file_date = ""
+
+    async def write(self, items: List[Dict]):
+        if not items:
+            return
+        async with self._lock:
+            await asyncio.to_thread(self._write, items)
+
+    async def flush(self):
+        async with self._lock:
+            if self._file is not None:
+                await asyncio.to_thread(self._file.flush)
+
+    async def close(self):
+        async with self._lock:
+            if self._file is not None:
+                await asyncio.to_thread(self._file.close)
+                self._file = None
+
+    def _write(self, items: List[Dict]):
+        if self._file is None or self._file_date != utils.get_current_date():
+            self._open_file()
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.columns, extrasaction="ignore")
+        writer.writerows(items)
+        self._file.write(buffer.getvalue())
+
+    def _open_file(self):
+        if self._file is not None:
+            self._file.close()
+        pathlib.Path(self.store_dir).mkdir(parents=True, exist_ok=True)
+        self._file_date = utils.get_current_date()
+        header = ",".join(self.columns)
+        file_path = os.path.join(self.store_dir, f"{self.store_type}_{self._file_date}.csv")
+        seq = 0
+        # 同一天已有的文件表头和当前列不一致(字段有增减)时，写入新文件，避免列错位
+        while os.path.exists(file_path) and os.path.getsize(file_path) > 0 and self._read_header(file_path) != header:
+            seq += 1
+            file_path = os.path.join(self.store_dir, f"{self.store_type}_{self._file_date}_{seq}.csv")
+        self._file = open(file_path, "a", encoding="utf-8", newline="", buffering=1024 * 1024)
+        if self._file.tell() == 0:
+            # 带 BOM 头，方便 Excel 识别 utf-8 编码
+            self._file.write("\ufeff" + header + "\r\n")
+
+    @staticmethod
+    def _read_header(file_path: str) -> str:
+        with open(file_path, encoding="utf-8-sig", newline="") as f:
+            return f.readline().rstrip("\r\n")
@@ -0,0 +1,199 @@
+import asyncio
+import gzip
+import json
+import os
+import pathlib
+import re
+import shutil
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple
+
+from tools import utils
+
+
+class JsonLinesWriter:
+    """
+    只追加写入的 json lines 文件，按日期和文件大小切分成多个分段文件: {store_type}_{日期}_{序号}.jsonl
+    切分后的分段文件可以压缩成 .jsonl.gz，文件读写都在线程中完成，不阻塞事件循环
+    指定 index_key 时维护一个 {store_type}.idx 索引文件，记录每个ID最后一次写入的分段文件和偏移量，可以按ID读回数据
+    每批数据落盘(fsync)之后才写入对应的索引，崩溃后索引不会指向还不存在的数据
+    """
+
+    def __init__(self, store_dir: str, store_type: str, max_bytes: int = 256 * 1024 * 1024,
+                 compress_rotated: bool = False, index_key: Optional[str] = None):
+        """
+        :param store_dir: 存储目录
+        :param store_type: 数据类型，作为文件名前缀
+        :param max_bytes: 单个分段文件的最大字节数
+        :param compress_rotated: 是否压缩切分后的分段文件
+        :param index_key: 建立索引的ID字段名，为空时不建立索引
+        """
+        self.store_dir = store_dir
+        self.store_type = store_type
+        self.max_bytes = max_bytes
+        self.compress_rotated = compress_rotated
+        self.index_key = index_key
+        self.index: Dict[str, Tuple[str, int]] = {}
+        self._lock = asyncio.Lock()
+        self._file: Optional[BinaryIO] = None
+        self._index_file: Optional[BinaryIO] = None
+        self._segment_name = ""
+        self._segment_date = ""
+        self._segment_size = 0
+        self._compress_tasks: Set[asyncio.Task] = set()
+
+    async def open(self):
+        async with self._lock:
+            await asyncio.to_thread(self._open)
+        if self.compress_rotated:
+            # 上一次运行留下的、之前日期的分段文件不会再写入，同样压缩
+            for segment_name in await asyncio.to_thread(self._find_stale_segments):
+                self._start_compress(segment_name)
+
+    async def write(self, items: List[Dict]):
+        """批量追加写入，一批数据只做一次文件写入"""
+        if not items:
+            return
+        async with self._lock:
+            rotated_name = await asyncio.to_thread(self._write, items)
+        if rotated_name and self.compress_rotated:
+            self._start_compress(rotated_name)
+
+    async def flush(self):
+        async with self._lock:
+            if self._file is not None:
+                await asyncio.to_thread(self._flush)
+
+    async def close(self):
+        async with self._lock:
+            if self._file is not None:
+                await asyncio.to_thread(self._close)
+        if self._compress_tasks:
+            await asyncio.gather(*self._compress_tasks)
+
+    async def read(self, key: str) -> Optional[Dict]:
+        """按索引读回ID最后一次写入的数据"""
+        position = self.index.get(key)
+        if position is None:
+            return None
+        async with self._lock:
+            if self._file is not None and position[0] == self._segment_name:
+                # 数据可能还在当前分段的写缓冲中
+                await asyncio.to_thread(self._flush)
+        return await asyncio.to_thread(self._read_line, key, *position)
+
+    def _start_compress(self, segment_name: str):
+        segment_path = os.path.join(self.store_dir, segment_name)
+        task = asyncio.create_task(asyncio.to_thread(self._compress_segment, segment_path))
+        self._compress_tasks.add(task)
+        task.add_done_callback(self._compress_tasks.discard)
+
+    def _open(self):
+        pathlib.Path(self.store_dir).mkdir(parents=True, exist_ok=True)
+        if self.index_key:
+            self._load_index()
+            self._index_file = open(self._index_path(), "ab")
+        self._open_segment()
+
+    def _open_segment(self):
+        """打开今天最后一个未写满、未压缩的分段文件继续写入，否则新建一个分段"""
+        self._segment_date = utils.get_current_date()
+        pattern = re.compile(rf"^{re.escape(self.store_type)}_{self._segment_date}_(\d+)\.jsonl(\.gz)?$")
+        last_seq, last_compressed = 0, False
+        for file_name in os.listdir(self.store_dir):
+            match = pattern.match(file_name)
+            if match and int(match.group(1)) >= last_seq:
+                last_seq, last_compressed = int(match.group(1)), bool(match.group(2))
+        seq = last_seq or 1
+        if last_compressed or (last_seq and os.path.getsize(self._segment_path(last_seq)) >= self.max_bytes):
+            seq = last_seq + 1
+        self._segment_name = f"{self.store_type}_{self._segment_date}_{seq:03d}.jsonl"
+        self._file = open(os.path.join(self.store_dir, self._segment_name), "ab", buffering=1024 * 1024)
+        self._segment_size = self._file.tell()
+
+    def _find_stale_segments(self) -> List[str]:
+        pattern = re.compile(rf"^{re.escape(self.store_type)}_(\d{{4}}-\d{{2}}-\d{{2}})_\d+\.jsonl$")
+        return [file_name for file_name in os.listdir(self.store_dir)
+                if (match := pattern.match(file_name)) and match.group(1) != self._segment_date]
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.store_dir, f"{self.store_type}_{self._segment_date}_{seq:03d}.jsonl")
+
+    def _index_path(self) -> str:
+        return os.path.join(self.store_dir, f"{self.store_type}.idx")
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path()):
+            return
+        with open(self._index_path(), "rb") as f:
+            for line in f:
+                parts = line.decode("utf-8").rstrip("\n").split("\t")
+                if len(parts) == 3:
+                    self.index[parts[0]] = (parts[1], int(parts[2]))
+
+    def _write(self, items: List[Dict]) -> Optional[str]:
+        """
+        :return: 写入前发生切分时返回被切分的分段文件名
+        """
+        rotated_name = None
+        if self._segment_date != utils.get_current_date() or self._segment_size >= self.max_bytes:
+            rotated_name = self._segment_name
+            self._file.close()
+            self._open_segment()
+        lines, index_lines = [], []
+        offset = self._segment_size
+        for item in items:
+            line = json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\n"
+            if self.index_key:
+                key = str(item.get(self.index_key))
+                self.index[key] = (self._segment_name, offset)
+                index_lines.append(f"{key}\t{self._segment_name}\t{offset}\n".encode("utf-8"))
+            lines.append(line)
+            offset += len(line)
+        self._file.write(b"".join(lines))
+        self._segment_size = offset
+        if index_lines:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._index_file.write(b"".join(index_lines))
+        return rotated_name
+
+    def _flush(self):
+        self._file.flush()
+        if self._index_file is not None:
+            self._index_file.flush()
+
+    def _close(self):
+        self._file.close()
+        self._file = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+
+    def _read_line(self, key: str, segment_name: str, offset: int) -> Optional[Dict]:
+        """
+        读取索引指向的一行数据
+        :return: 数据不存在、无法解析或者不是这个ID的数据(索引损坏)时返回 None
+        """
+        segment_path = os.path.join(self.store_dir, segment_name)
+        if os.path.exists(segment_path):
+            f = open(segment_path, "rb")
+        elif os.path.exists(segment_path + ".gz"):
+            f = gzip.open(segment_path + ".gz", "rb")
+        else:
+            return None
+        try:
+            with f:
+                f.seek(offset)
+                record = json.loads(f.readline())
+        except (ValueError, EOFError, gzip.BadGzipFile):
+            return None
+        if not isinstance(record, dict) or str(record.get(self.index_key)) != key:
+            return None
+        return record
+
+    @staticmethod
+    def _compress_segment(segment_path: str):
+        with open(segment_path, "rb") as src, gzip.open(segment_path + ".gz.tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(segment_path + ".gz.tmp", segment_path + ".gz")
+        os.remove(segment_path)
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import pathlib
+from typing import Dict, List, Optional
+
+from tools import utils
+
+
+class ParquetWriter:
+    """
+    按天分区写入的 parquet 文件: {store_type}/date={日期}/part-{时间戳}-{进程ID}-{序号}.parquet (需要安装 pyarrow: pip install pyarrow)
+    数据先在内存中缓冲，攒够一个行组的数据量后转换成 Arrow 列式数据，写成一个只有一个行组的完整文件，关闭时写入剩余数据
+    每个文件先写临时文件再重命名，中途崩溃不会留下缺少文件尾、无法读取的文件，最多丢失还在内存中的一个行组
+    列类型:
+        string: 字符串
+        dictionary: 字典编码的字符串，适合取值重复较多的列
+        int64: 整数
+        timestamp: 毫秒时间戳
+    """
+
+    def __init__(self, store_dir: str, store_type: str, columns: Dict[str, str],
+                 row_group_size: int = 10000, compression: str = "zstd"):
+        """
+        :param store_dir: 存储目录
+        :param store_type: 数据类型，作为子目录名
+        :param columns: 列名 -> 列类型，按顺序写入
+        :param row_group_size: 每个行组的行数
+        :param compression: 压缩算法
+        """
+        self.store_dir = store_dir
+        self.store_type = store_type
+        self.columns = columns
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self._rows: List[Dict] = []
+        self._lock = asyncio.Lock()
+        self._schema = None
+        self._file_prefix = f"part-{utils.get_current_timestamp()}-{os.getpid()}"
+        self._file_seq = 0
+
+    async def write(self, items: List[Dict]):
+        self._rows.extend(items)
+        if len(self._rows) < self.row_group_size:
+            return
+        async with self._lock:
+            while len(self._rows) >= self.row_group_size:
+                rows, self._rows = self._rows[:self.row_group_size], self._rows[self.row_group_size:]
+                await asyncio.to_thread(self._write_row_group, rows)
+
+    async def close(self):
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            if rows:
+                await asyncio.to_thread(self._write_row_group, rows)
+
+    def _write_row_group(self, rows: List[Dict]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = self._get_schema()
+        arrays = []
+        for column, column_type in self.columns.items():
+            values = [row.get(column) for row in rows]
+            if column_type in ("int64", "timestamp"):
+                values = [self._to_int(value) for value in values]
+            else:
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(pa.array(values, type=schema.field(column).type))
+        table = pa.Table.from_arrays(arrays, schema=schema)
+        partition_dir = os.path.join(self.store_dir, self.store_type, f"date={utils.get_current_date()}")
+        pathlib.Path(partition_dir).mkdir(parents=True, exist_ok=True)
+        self._file_seq += 1
+        file_path = os.path.join(partition_dir, f"{self._file_prefix}-{self._file_seq:05d}.parquet")
+        # 临时文件不以 part- 开头，读取分区目录时不会读到写了一半的文件
+        tmp_file_path = os.path.join(partition_dir, f".{self._file_prefix}-{self._file_seq:05d}.parquet.tmp")
+        pq.write_table(table, tmp_file_path, row_group_size=len(rows), compression=self.compression)
+        os.replace(tmp_file_path, file_path)
+
+    def _get_schema(self):
+        import pyarrow as pa
+
+        if self._schema is None:
+            arrow_types = {
+                "string": pa.string(),
+                "dictionary": pa.dictionary(pa.int32(), pa.string()),
+                "int64": pa.int64(),
+                "timestamp": pa.timestamp("ms"),
+            }
+            self._schema = pa.schema([(column, arrow_types[column_type])
+                                      for column, column_type in self.columns.items()])
+        return self._schema
+
+    @staticmethod
+    def _to_int(value) -> Optional[int]:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,107 @@
+import asyncio
+import pathlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+
+class SqliteTable:
+    """sqlite 表结构，根据列定义生成建表、补充字段和 upsert 语句"""
+
+    def __init__(self, name: str, columns: Dict[str, str], unique_key: str,
+                 indexes: Sequence[Union[str, Tuple[str, ...]]] = (), hash_column: Optional[str] = None):
+        """
+        :param name: 表名
+        :param columns: 列名 -> 列类型(INTEGER | TEXT)，不包含自增ID和 add_ts
+        :param unique_key: 唯一键列名，upsert 时按该列判断冲突
+        :param indexes: 需要建立普通索引的列，多列的联合索引使用元组
+        :param hash_column: 内容指纹列，指定时已存在的数据只有指纹变化才更新
+        """
+        self.name = name
+        self.columns = columns
+        self.unique_key = unique_key
+        self.indexes = indexes
+        insert_columns = [*columns, "add_ts"]
+        update_columns = [column for column in columns if column != unique_key]
+        self.upsert_sql = (
+            f'INSERT INTO {name} ({", ".join(self.quote(c) for c in insert_columns)}) '
+            f'VALUES ({", ".join("?" for _ in insert_columns)}) '
+            f'ON CONFLICT({self.quote(unique_key)}) DO UPDATE SET '
+            f'{", ".join(f"{self.quote(c)} = excluded.{self.quote(c)}" for c in update_columns)}'
+        )
+        if hash_column:
+            self.upsert_sql += f" WHERE {self.quote(hash_column)} IS NOT excluded.{self.quote(hash_column)}"
+
+    @staticmethod
+    def quote(column: str) -> str:
+        return f'"{column}"'
+
+    def create_statements(self, existing_columns: Sequence[str]) -> List[str]:
+        """建表语句，表已存在时只补充缺少的字段"""
+        if not existing_columns:
+            column_defs = ", ".join(f"{self.quote(c)} {t}" for c, t in self.columns.items())
+            statements = [f"CREATE TABLE {self.name} (id INTEGER PRIMARY KEY AUTOINCREMENT, {column_defs}, "
+                          f"add_ts INTEGER)"]
+        else:
+            statements = [f"ALTER TABLE {self.name} ADD COLUMN {self.quote(c)} {t}"
+                          for c, t in self.columns.items() if c not in existing_columns]
+        statements.append(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{self.name}_{self.unique_key} "
+                          f"ON {self.name} ({self.quote(self.unique_key)})")
+        for index_columns in self.indexes:
+            if isinstance(index_columns, str):
+                index_columns = (index_columns,)
+            statements.append(f"CREATE INDEX IF NOT EXISTS idx_{self.name}_{'_'.join(index_columns)} "
+                              f"ON {self.name} ({', '.join(self.quote(c) for c in index_columns)})")
+        return statements
+
+    def to_rows(self, items: List[Dict], add_ts: int) -> List[tuple]:
+        return [tuple(item.get(column) for column in self.columns) + (add_ts,) for item in items]
+
+
+class SqliteClient:
+    """
+    sqlite 数据库，所有操作都在同一个线程中串行执行，不阻塞事件循环
+    使用 WAL 模式，每批数据在一个事务中写入
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def open(self, tables: Sequence[SqliteTable]):
+        await self._run(self._open, tables)
+
+    async def upsert(self, table: SqliteTable, items: List[Dict], add_ts: int):
+        if items:
+            await self._run(self._executemany, table.upsert_sql, table.to_rows(items, add_ts))
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        return await self._run(self._fetchall, sql, params)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self, tables: Sequence[SqliteTable]):
+        pathlib.Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for table in tables:
+                existing_columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table.name})")]
+                for statement in table.create_statements(existing_columns):
+                    self._conn.execute(statement)
+
+    def _executemany(self, sql: str, rows: List[tuple]):
+        with self._conn:
+            self._conn.executemany(sql, rows)
+
+    def _fetchall(self, sql: str, params: Sequence[Any]) -> List[tuple]:
+        return self._conn.execute(sql, params).fetchall()
@@ -0,0 +1,274 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import config
+from base.base_crawler import AbstractStore
+from tools import utils
+
+
+class WriteBehindStore(AbstractStore):
+    """
+    写缓冲存储，爬虫写入的数据先放入内存缓冲区立即返回，由后台任务按数量或时间批量写入真正的存储
+    缓冲区中同一条数据多次写入只保留最后一次，缓冲数据量达到上限时写入方会等待刷新完成，内存占用有上限
+    整批写入失败时逐条重试，写不进去的数据放回缓冲区下一轮重试，同一条数据连续失败超过次数后记录日志丢弃，
+    个别有问题的数据不会阻塞其他数据的写入
+    """
+
+    def __init__(self, store: AbstractStore, content_id_key: str, comment_id_key: str,
+                 batch_size: int = 200, flush_interval: float = 2.0, max_pending: int = 2000,
+                 max_retries: int = 10):
+        """
+        :param store: 真正写入数据的存储
+        :param content_id_key: 内容数据中的ID字段名
+        :param comment_id_key: 评论数据中的ID字段名
+        :param batch_size: 缓冲数据达到多少条时触发刷新
+        :param flush_interval: 最长多少秒刷新一次
+        :param max_pending: 缓冲数据达到多少条时写入方等待刷新完成
+        :param max_retries: 同一条数据最多连续写入失败几次
+        """
+        self.store = store
+        self.content_id_key = content_id_key
+        self.comment_id_key = comment_id_key
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        # (数据类型, 数据ID) -> 连续写入失败的次数
+        self._failed_attempts: Dict[tuple, int] = {}
+        self._pending_contents: Dict[str, Dict] = {}
+        self._pending_comments: Dict[str, Dict] = {}
+        self._pending_creators: List[Dict] = []
+        # 正在写入的数据，写入完成前查询仍然能看到
+        self._flushing_contents: Dict[str, Dict] = {}
+        self._flushing_comments: Dict[str, Dict] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_event = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending_contents) + len(self._pending_comments) + len(self._pending_creators)
+
+    async def open(self):
+        if self._flush_task is not None:
+            return
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        await self.store.open()
+
+    async def flush(self, final: bool = False):
+        """
+        把缓冲区中的数据写入存储
+        :param final: 关闭前的最后一次刷新，写入失败的数据不再重试，记录日志后丢弃
+        :return:
+        """
+        async with self._flush_lock:
+            self._flushing_contents, self._pending_contents = self._pending_contents, {}
+            self._flushing_comments, self._pending_comments = self._pending_comments, {}
+            creators, self._pending_creators = self._pending_creators, []
+            try:
+                failed_contents = await self._write_items(self._flushing_contents, self.store.store_contents)
+                failed_comments = await self._write_items(self._flushing_comments, self.store.store_comments)
+                # 创作者数据没有统一的ID字段，用对象本身区分
+                flushing_creators = {id(creator): creator for creator in creators}
+                failed_creators = await self._write_items(flushing_creators, self._store_creators)
+                written_count = (len(self._flushing_contents) + len(self._flushing_comments) + len(creators)
+                                 - len(failed_contents) - len(failed_comments) - len(failed_creators))
+                # 写入失败的数据放回缓冲区，下一轮刷新重试，刷新期间新写入的同一条数据以新数据为准
+                # 同一条数据连续失败超过次数后丢弃(例如字段校验失败的数据)，不会一直阻塞后续写入
+                self._pending_contents = {
+                    **{key: self._flushing_contents[key]
+                       for key in self._retryable("content", self._flushing_contents, failed_contents, final)},
+                    **self._pending_contents
+                }
+                self._pending_comments = {
+                    **{key: self._flushing_comments[key]
+                       for key in self._retryable("comment", self._flushing_comments, failed_comments, final)},
+                    **self._pending_comments
+                }
+                retry_creator_ids = set(self._retryable("creator", flushing_creators, failed_creators, final))
+                self._pending_creators = ([creator for creator in creators if id(creator) in retry_creator_ids]
+                                          + self._pending_creators)
+                errors = [*failed_contents.values(), *failed_comments.values(), *failed_creators.values()]
+                if errors and not written_count:
+                    # 一条都写不进去，大概率是存储不可用
+                    raise errors[0]
+                await self.store.flush()
+            finally:
+                self._flushing_contents, self._flushing_comments = {}, {}
+
+    @staticmethod
+    async def _write_items(items: Dict, write: Callable[[List[Dict]], Awaitable]) -> Dict:
+        """
+        批量写入数据，整批写入失败时逐条重试
+        :param items: 数据ID -> 数据
+        :param write: 批量写入的方法
+        :return: 逐条重试仍然写入失败的数据ID -> 异常
+        """
+        if not items:
+            return {}
+        try:
+            await write(list(items.values()))
+            return {}
+        except Exception as ex:
+            utils.logger.warning(f"[WriteBehindStore._write_items] write {len(items)} items error: {ex!r}, "
+                                 f"retry one by one")
+        errors = {}
+        for key, item in items.items():
+            try:
+                await write([item])
+            except Exception as ex:
+                errors[key] = ex
+        return errors
+
+    def _retryable(self, kind: str, items: Dict, errors: Dict, final: bool = False) -> List:
+        """
+        更新每条数据连续写入失败的次数，返回还可以重试的数据ID，超过重试次数的数据记录日志后丢弃
+        :param kind: 数据类型
+        :param items: 这一批写入的数据ID -> 数据
+        :param errors: 写入失败的数据ID -> 异常
+        :param final: 不再重试，全部丢弃
+        :return:
+        """
+        if self._failed_attempts:
+            # 之前失败过、这一次写入成功的数据重新计数
+            for key in items:
+                if key not in errors:
+                    self._failed_attempts.pop((kind, key), None)
+        retry_keys = []
+        for key, ex in errors.items():
+            attempts = self._failed_attempts.pop((kind, key), 0) + 1
+            if attempts < self.max_retries and not final:
+                self._failed_attempts[(kind, key)] = attempts
+                retry_keys.append(key)
+            else:
+                utils.logger.error(f"[WriteBehindStore.flush] drop {kind} {key} after {attempts} failed writes "
+                                   f"to {type(self.store).__name__}: {ex!r}")
+        return retry_keys
+
+    async def _store_creators(self, creators: List[Dict]):
+        for creator in creators:
+            await self.store.store_creator(creator)
+
+    async def close(self):
+        if self._flush_task is not None:
+            # 不取消后台任务，避免正在写入的一批数据丢失，等待它结束当前这一轮刷新
+            self._closing = True
+            self._flush_event.set()
+            await self._flush_task
+            self._flush_task = None
+        try:
+            await self.flush(final=True)
+        finally:
+            await self.store.close()
+
+    async def store_content(self, content_item: Dict):
+        self._pending_contents[content_item.get(self.content_id_key)] = content_item
+        await self._after_write()
+
+    async def store_contents(self, content_items: List[Dict]):
+        for content_item in content_items:
+            self._pending_contents[content_item.get(self.content_id_key)] = content_item
+        await self._after_write()
+
+    async def store_comment(self, comment_item: Dict):
+        self._pending_comments[comment_item.get(self.comment_id_key)] = comment_item
+        await self._after_write()
+
+    async def store_comments(self, comment_items: List[Dict]):
+        for comment_item in comment_items:
+            self._pending_comments[comment_item.get(self.comment_id_key)] = comment_item
+        await self._after_write()
+
+    async def store_creator(self, creator: Dict):
+        self._pending_creators.append(creator)
+        await self._after_write()
+
+    async def query_content_state(self, content_id: str) -> Optional[Dict]:
+        content_item = self._pending_contents.get(content_id) or self._flushing_contents.get(content_id)
+        if content_item is not None:
+            return content_item
+        return await self.store.query_content_state(content_id)
+
+    async def query_stored_comment_ids(self, comment_ids: List[str]) -> Set[str]:
+        buffered_ids = {comment_id for comment_id in comment_ids
+                        if comment_id in self._pending_comments or comment_id in self._flushing_comments}
+        stored_ids = await self.store.query_stored_comment_ids(
+            [comment_id for comment_id in comment_ids if comment_id not in buffered_ids]
+        )
+        return buffered_ids | stored_ids
+
+    async def _after_write(self):
+        pending_count = self.pending_count
+        if pending_count >= self.max_pending:
+            await self.flush()
+        elif pending_count >= self.batch_size:
+            self._flush_event.set()
+
+    async def _flush_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as ex:
+                utils.logger.error(f"[WriteBehindStore._flush_loop] flush to {type(self.store).__name__} error: {ex!r}")
+
+
+class StoreManager:
+    """存储管理器，每种存储方式只创建一个实例，统一管理存储的打开、刷新和关闭"""
+    _stores: Dict[str, AbstractStore] = {}
+    _open_futures: Dict[str, asyncio.Future] = {}
+
+    @classmethod
+    async def get_store(cls, name: str, store_factory: Callable[[], AbstractStore],
+                        content_id_key: str, comment_id_key: str) -> AbstractStore:
+        """
+        获取存储实例，第一次获取时创建并打开
+        :param name: 存储名称，同名只创建一次
+        :param store_factory: 创建存储实例的函数
+        :param content_id_key: 内容数据中的ID字段名
+        :param comment_id_key: 评论数据中的ID字段名
+        :return:
+        """
+        store = cls._stores.get(name)
+        if store is None:
+            store = store_factory()
+            if config.ENABLE_STORE_WRITE_BEHIND:
+                store = WriteBehindStore(
+                    store,
+                    content_id_key=content_id_key,
+                    comment_id_key=comment_id_key,
+                    batch_size=config.STORE_FLUSH_BATCH_SIZE,
+                    flush_interval=config.STORE_FLUSH_INTERVAL,
+                    max_pending=config.STORE_MAX_PENDING,
+                    max_retries=config.STORE_FLUSH_MAX_RETRIES
+                )
+            cls._stores[name] = store
+            # 并发的第一次获取共享同一个打开过程
+            cls._open_futures[name] = asyncio.ensure_future(store.open())
+        await cls._open_futures[name]
+        return store
+
+    @classmethod
+    async def flush_all(cls):
+        for store in cls._stores.values():
+            await store.flush()
+
+    @classmethod
+    async def close_all(cls):
+        """关闭所有存储，关闭前把缓冲区中的数据全部写入"""
+        stores, cls._stores, cls._open_futures = cls._stores, {}, {}
+        error: Optional[Exception] = None
+        for name, store in stores.items():
+            try:
+                await store.close()
+            except Exception as ex:
+                utils.logger.error(f"[StoreManager.close_all] close store {name} error: {ex!r}")
+                error = error or ex
+        # 所有存储都关闭后再抛出异常，数据没有写入成功时不能当作正常结束
+        if error is not None:
+            raise error
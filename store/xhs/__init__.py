@@ -1,26 +1,43 @@
+import json
+
 import config
 from .xhs_store_db_types import *
 from .xhs_store_impl import *
 from base.base_crawler import AbstractStore
-from typing import List, Dict
+from store.content_hash import make_content_hash
+from store.store_manager import StoreManager
+from typing import List, Dict, Optional, Set
 from tools import utils
+from tools.count_parser import parse_counts
 
 
 class XhsStoreFactory:
     STORES = {
         "csv": XhsCsvStoreImplement,
         "db": XhsDbStoreImplement,
-        "json": XhsJsonStoreImplement
+        "json": XhsJsonStoreImplement,
+        "parquet": XhsParquetStoreImplement,
+        "sqlite": XhsSqliteStoreImplement
     }
 
     @staticmethod
     def create_store() -> AbstractStore:
         store_class = XhsStoreFactory.STORES.get(config.SAVE_DATA_OPTION)
         if not store_class:
-            raise ValueError("[XhsStoreFactory.create_store] Invalid save option only supported csv or db or json...")
+            raise ValueError("[XhsStoreFactory.create_store] Invalid save option only supported csv or db or json or parquet or sqlite...")
         return store_class()
 
 
+async def get_xhs_store() -> AbstractStore:
+    """获取当前存储方式的存储实例，整个进程共用一个"""
+    return await StoreManager.get_store(
+        name=f"xhs_{config.SAVE_DATA_OPTION}",
+        store_factory=XhsStoreFactory.create_store,
+        content_id_key="note_id",
+        comment_id_key="comment_id"
+    )
+
+
 async def update_xhs_note(note_item: Dict):
     note_id = note_item.get("note_id")
     user_info = note_item.get("user", {})
@@ -34,6 +51,12 @@ async def update_xhs_note(note_item: Dict):
         if type(videos).__name__ == 'list':
             video_url = ','.join([v.get('master_url') for v in videos])
 
+    liked_count_num, collected_count_num, comment_count_num, share_count_num = parse_counts([
+        interact_info.get("liked_count"),
+        interact_info.get("collected_count"),
+        interact_info.get("comment_count"),
+        interact_info.get("share_count")
+    ])
     local_db_item = {
         "note_id": note_item.get("note_id"),
         "type": note_item.get("type"),
@@ -49,23 +72,37 @@ async def update_xhs_note(note_item: Dict):
         "collected_count": interact_info.get("collected_count"),
         "comment_count": interact_info.get("comment_count"),
         "share_count": interact_info.get("share_count"),
+        "liked_count_num": liked_count_num,
+        "collected_count_num": collected_count_num,
+        "comment_count_num": comment_count_num,
+        "share_count_num": share_count_num,
         "ip_location": note_item.get("ip_location", ""),
         "image_list": ','.join([img.get('url', '') for img in image_list]),
         "tag_list": ','.join([tag.get('name', '') for tag in tag_list if tag.get('type') == 'topic']),
         "last_modify_ts": utils.get_current_timestamp(),
         "note_url": f"https://www.xiaohongshu.com/explore/{note_id}"
     }
-    await XhsStoreFactory.create_store().store_content(local_db_item)
+    local_db_item["content_hash"] = make_content_hash(local_db_item)
+    xhs_store = await get_xhs_store()
+    await xhs_store.store_content(local_db_item)
 
 
-async def batch_update_xhs_note_comments(note_id: str, comments: List[Dict]):
+async def batch_update_xhs_note_comments(note_id: str, comments: List[Dict], parent_comment_id: str = ""):
     if not comments:
         return
-    for comment_item in comments:
-        await update_xhs_note_comment(note_id, comment_item)
+    xhs_store = await get_xhs_store()
+    await xhs_store.store_comments(
+        [build_xhs_note_comment_item(note_id, comment_item, parent_comment_id) for comment_item in comments]
+    )
+
+
+async def update_xhs_note_comment(note_id: str, comment_item: Dict, parent_comment_id: str = ""):
+    local_db_item = build_xhs_note_comment_item(note_id, comment_item, parent_comment_id)
+    xhs_store = await get_xhs_store()
+    await xhs_store.store_comment(local_db_item)
 
 
-async def update_xhs_note_comment(note_id: str, comment_item: Dict):
+def build_xhs_note_comment_item(note_id: str, comment_item: Dict, parent_comment_id: str = "") -> Dict:
     user_info = comment_item.get("user_info", {})
     comment_id = comment_item.get("id")
     comment_pictures = [item.get("url_default", "") for item in comment_item.get("pictures", [])]
@@ -74,12 +111,63 @@ async def update_xhs_note_comment(note_id: str, comment_item: Dict):
         "create_time": comment_item.get("create_time"),
         "ip_location": comment_item.get("ip_location"),
         "note_id": note_id,
+        "parent_comment_id": parent_comment_id,
         "content": comment_item.get("content"),
         "user_id": user_info.get("user_id"),
         "nickname": user_info.get("nickname"),
         "avatar": user_info.get("image"),
-        "sub_comment_count": comment_item.get("sub_comment_count"),
+        # 回复(二级评论)数据中没有 sub_comment_count 字段
+        "sub_comment_count": comment_item.get("sub_comment_count") or 0,
         "pictures": ",".join(comment_pictures),
         "last_modify_ts": utils.get_current_timestamp(),
     }
-    await XhsStoreFactory.create_store().store_comment(local_db_item)
+    local_db_item["content_hash"] = make_content_hash(local_db_item)
+    return local_db_item
+
+
+async def save_creator(user_id: str, creator: Dict):
+    xhs_store = await get_xhs_store()
+    await xhs_store.store_creator(build_xhs_creator_item(user_id, creator))
+
+
+def build_xhs_creator_item(user_id: str, creator: Dict) -> Dict:
+    """
+    博主主页数据转换成存储字段，关注数、粉丝数、获赞和收藏数同时保存展示值和解析后的整数
+    :param user_id: 博主ID
+    :param creator: 博主主页数据 {"basicInfo": {...}, "interactions": [...], "tags": [...]}
+    :return:
+    """
+    user_info = creator.get("basicInfo", {})
+    interactions = {item.get("type"): item.get("count") for item in creator.get("interactions", [])}
+    follows, fans, interaction = interactions.get("follows"), interactions.get("fans"), interactions.get("interaction")
+    follows_num, fans_num, interaction_num = parse_counts([follows, fans, interaction])
+    local_db_item = {
+        "user_id": user_id,
+        "nickname": user_info.get("nickname"),
+        "gender": "女" if user_info.get("gender") == 1 else "男",
+        "avatar": user_info.get("images"),
+        "desc": user_info.get("desc"),
+        "ip_location": user_info.get("ipLocation"),
+        "follows": follows,
+        "fans": fans,
+        "interaction": interaction,
+        "follows_num": follows_num,
+        "fans_num": fans_num,
+        "interaction_num": interaction_num,
+        "tag_list": json.dumps({tag.get("tagType"): tag.get("name") for tag in creator.get("tags", [])},
+                               ensure_ascii=False),
+        "last_modify_ts": utils.get_current_timestamp(),
+    }
+    local_db_item["content_hash"] = make_content_hash(local_db_item)
+    return local_db_item
+
+
+async def get_xhs_note_state(note_id: str) -> Optional[Dict]:
+    """已存储笔记的 last_update_time 和 comment_count，未存储或存储方式不支持查询时返回 None"""
+    xhs_store = await get_xhs_store()
+    return await xhs_store.query_content_state(note_id)
+
+
+async def get_stored_xhs_comment_ids(comment_ids: List[str]) -> Set[str]:
+    xhs_store = await get_xhs_store()
+    return await xhs_store.query_stored_comment_ids(comment_ids)
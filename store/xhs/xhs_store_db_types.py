@@ -10,13 +10,14 @@ class XhsBaseModel(Model):
     ip_location = fields.CharField(null=True, max_length=255, description="评论时的Ip地址")
     add_ts = fields.BigIntField(description="记录添加时间戳")
     last_modify_ts = fields.BigIntField(description='记录最后修改时间戳')
+    content_hash = fields.CharField(null=True, max_length=32, description="内容指纹, 内容没有变化时跳过写入")
 
     class Meta:
         abstract = True
 
 
 class XHSNote(XhsBaseModel):
-    note_id = fields.CharField(max_length=64, index=True, description="笔记ID")
+    note_id = fields.CharField(max_length=64, unique=True, description="笔记ID")
     type = fields.CharField(null=True, max_length=16, description="笔记类型(normal | video)")
     title = fields.CharField(null=True, max_length=255, description="笔记标题")
     desc = fields.TextField(null=True, description="笔记描述")
@@ -27,6 +28,10 @@ class XHSNote(XhsBaseModel):
     collected_count = fields.CharField(null=True, max_length=16, description="笔记收藏数")
     comment_count = fields.CharField(null=True, max_length=16, description="笔记评论数")
     share_count = fields.CharField(null=True, max_length=16, description="笔记分享数")
+    liked_count_num = fields.BigIntField(null=True, index=True, description="笔记点赞数(整数)")
+    collected_count_num = fields.BigIntField(null=True, index=True, description="笔记收藏数(整数)")
+    comment_count_num = fields.BigIntField(null=True, index=True, description="笔记评论数(整数)")
+    share_count_num = fields.BigIntField(null=True, index=True, description="笔记分享数(整数)")
     image_list = fields.TextField(null=True, description="笔记封面图片列表")
     tag_list = fields.TextField(null=True, description="标签列表")
     note_url = fields.CharField(null=True, max_length=255, description="笔记详情页的URL")
@@ -40,9 +45,10 @@ class XHSNote(XhsBaseModel):
 
 
 class XHSNoteComment(XhsBaseModel):
-    comment_id = fields.CharField(max_length=64, index=True, description="评论ID")
+    comment_id = fields.CharField(max_length=64, unique=True, description="评论ID")
     create_time = fields.BigIntField(index=True, description="评论时间戳")
     note_id = fields.CharField(max_length=64, description="笔记ID")
+    parent_comment_id = fields.CharField(null=True, max_length=64, index=True, description="一级评论ID, 一级评论为空")
     content = fields.TextField(description="评论内容")
     sub_comment_count = fields.IntField(description="子评论数量")
     pictures = fields.CharField(null=True, max_length=512, description="评论的图片集合")
@@ -50,6 +56,8 @@ class XHSNoteComment(XhsBaseModel):
     class Meta:
         table = "xhs_note_comment"
         table_description = "小红书笔记评论"
+        # 按笔记查询评论串并按时间排序，同时覆盖只按 note_id 的查询
+        indexes = (("note_id", "create_time"),)
 
     def __str__(self):
         return f"{self.comment_id} - {self.content}"
@@ -60,7 +68,10 @@ class XhsCreator(XhsBaseModel):
     gender = fields.CharField(null=True, max_length=1, description="性别")
     follows = fields.CharField(null=True, max_length=16, description="关注数")
     fans = fields.CharField(null=True, max_length=16, description="粉丝数")
+    follows_num = fields.BigIntField(null=True, index=True, description="关注数(整数)")
+    fans_num = fields.BigIntField(null=True, index=True, description="粉丝数(整数)")
     interaction = fields.CharField(null=True, max_length=16, description="获赞和收藏数")
+    interaction_num = fields.BigIntField(null=True, index=True, description="获赞和收藏数(整数)")
     tag_list = fields.TextField(null=True, description="标签列表")  # json字符串
 
     class Meta:
@@ -1,102 +1,298 @@
-import asyncio
-import csv
-import json
-import pathlib
-import os
-import aiofiles
-
+import config
 from base.base_crawler import AbstractStore
-from typing import Dict
+from typing import Dict, List, Optional, Set, Type
+from store.content_hash import ContentHashCache
+from store.csv_writer import CsvWriter
+from store.jsonl_writer import JsonLinesWriter
+from store.parquet_writer import ParquetWriter
+from store.sqlite_client import SqliteClient, SqliteTable
 from tools import utils
 from tortoise.contrib.pydantic import pydantic_model_creator
+from tortoise.models import Model
+from .xhs_store_db_types import XHSNote, XHSNoteComment, XhsCreator
+
+
+# pydantic 模型只在导入时创建一次，用于校验入库数据
+XHSNotePydantic = pydantic_model_creator(XHSNote, name="XHSPydanticCreate", exclude=('id',))
+XHSNoteCommentPydantic = pydantic_model_creator(XHSNoteComment, name="CommentPydanticCreate", exclude=('id',))
+
+# 已存在的记录只更新这些字段，保留第一次入库时的 add_ts
+XHS_NOTE_UPDATE_FIELDS = [f for f in XHSNotePydantic.model_fields if f not in ("note_id", "add_ts")]
+XHS_NOTE_COMMENT_UPDATE_FIELDS = [f for f in XHSNoteCommentPydantic.model_fields if f not in ("comment_id", "add_ts")]
+
+
+async def filter_changed_items(model: Type[Model], key: str, items: List[Dict],
+                               hash_cache: ContentHashCache) -> List[Dict]:
+    """
+    过滤掉内容指纹和已存储数据相同的数据，本地缓存中没有的ID先批量查询已存储的指纹
+    :param model: 表模型
+    :param key: 唯一键字段
+    :param items: 待写入的数据
+    :param hash_cache: 已存储数据的指纹缓存
+    :return: 新数据和内容有变化的数据
+    """
+    unknown_ids = [item.get(key) for item in items if item.get(key) not in hash_cache]
+    if unknown_ids:
+        stored_hashes = await model.filter(**{f"{key}__in": unknown_ids}).values_list(key, "content_hash")
+        for item_id, content_hash in stored_hashes:
+            hash_cache.put(item_id, content_hash)
+    return [item for item in items
+            if item.get("content_hash") is None or hash_cache.get(item.get(key)) != item.get("content_hash")]
 
 
 class XhsDbStoreImplement(AbstractStore):
+    def __init__(self):
+        self.note_hash_cache = ContentHashCache(config.CONTENT_HASH_CACHE_SIZE)
+        self.comment_hash_cache = ContentHashCache(config.CONTENT_HASH_CACHE_SIZE)
+
     async def store_comment(self, comment_item: Dict):
-        from xhs_store_db_types import XHSNoteComment
-        comment_id = comment_item.get("comment_id")
-        if not await XHSNoteComment.filter(comment_id=comment_id).first():
-            comment_item["add_ts"] = utils.get_current_timestamp()
-            comment_pydantic = pydantic_model_creator(XHSNoteComment, name="CommentPydanticCreate", exclude=('id',))
-            comment_data = comment_pydantic(**comment_item)
-            comment_pydantic.model_validate(comment_data)
-            await XHSNoteComment.create(**comment_data.model_dump())
-        else:
-            comment_pydantic = pydantic_model_creator(XHSNoteComment, name="CommentPydanticUpdate",
-                                                      exclude=('id', 'add_ts'))
-            comment_data = comment_pydantic(**comment_item)
-            comment_pydantic.model_validate(comment_data)
-            await XHSNoteComment.filter(comment_id=comment_id).update(**comment_data.model_dump())
+        await self.store_comments([comment_item])
+
+    async def store_comments(self, comment_items: List[Dict]):
+        """批量 upsert 评论，一次往返写入一页评论(MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE)"""
+        if config.ENABLE_CONTENT_HASH_SKIP:
+            comment_items = await filter_changed_items(XHSNoteComment, "comment_id", comment_items,
+                                                       self.comment_hash_cache)
+        if not comment_items:
+            return
+        add_ts = utils.get_current_timestamp()
+        comments = [
+            XHSNoteComment(**XHSNoteCommentPydantic(**{"add_ts": add_ts, **comment_item}).model_dump())
+            for comment_item in comment_items
+        ]
+        await XHSNoteComment.bulk_create(comments, on_conflict=["comment_id"],
+                                         update_fields=XHS_NOTE_COMMENT_UPDATE_FIELDS)
+        for comment_item in comment_items:
+            self.comment_hash_cache.put(comment_item.get("comment_id"), comment_item.get("content_hash"))
 
     async def store_content(self, content_item: Dict):
-        from xhs_store_db_types import XHSNote
-        note_id = content_item.get("note_id")
-        if not await XHSNote.filter(note_id=note_id).first():
-            content_item["add_ts"] = utils.get_current_timestamp()
-            note_pydantic = pydantic_model_creator(XHSNote, name="XHSPydanticCreate", exclude=('id',))
-            note_data = note_pydantic(**content_item)
-            note_pydantic.model_validate(note_data)
-            await XHSNote.create(**note_data.model_dump())
-        else:
-            note_pydantic = pydantic_model_creator(XHSNote, name="XHSPydanticUpdate", exclude=('id', 'add_ts'))
-            note_data = note_pydantic(**content_item)
-            note_pydantic.model_validate(note_data)
-            await XHSNote.filter(note_id=note_id).update(**note_data.model_dump())
+        await self.store_contents([content_item])
+
+    async def store_contents(self, content_items: List[Dict]):
+        """批量 upsert 笔记"""
+        if config.ENABLE_CONTENT_HASH_SKIP:
+            content_items = await filter_changed_items(XHSNote, "note_id", content_items, self.note_hash_cache)
+        if not content_items:
+            return
+        add_ts = utils.get_current_timestamp()
+        notes = [
+            XHSNote(**XHSNotePydantic(**{"add_ts": add_ts, **content_item}).model_dump())
+            for content_item in content_items
+        ]
+        await XHSNote.bulk_create(notes, on_conflict=["note_id"], update_fields=XHS_NOTE_UPDATE_FIELDS)
+        for content_item in content_items:
+            self.note_hash_cache.put(content_item.get("note_id"), content_item.get("content_hash"))
 
     async def store_creator(self, creator: Dict):
         pass
 
+    async def query_content_state(self, content_id: str) -> Optional[Dict]:
+        rows = await XHSNote.filter(note_id=content_id).limit(1).values("last_update_time", "comment_count")
+        return rows[0] if rows else None
+
+    async def query_stored_comment_ids(self, comment_ids: List[str]) -> Set[str]:
+        if not comment_ids:
+            return set()
+        return set(await XHSNoteComment.filter(comment_id__in=comment_ids).values_list("comment_id", flat=True))
+
+
+# csv 列顺序和数据库表字段保持一致(不包含自增ID和入库时间)
+XHS_NOTE_CSV_COLUMNS = [f for f in XHSNotePydantic.model_fields if f != "add_ts"]
+XHS_NOTE_COMMENT_CSV_COLUMNS = [f for f in XHSNoteCommentPydantic.model_fields if f != "add_ts"]
+XHS_CREATOR_CSV_COLUMNS = [f for f in pydantic_model_creator(XhsCreator, name="CreatorPydanticCreate",
+                                                             exclude=('id', 'add_ts')).model_fields]
+
 
 class XhsCsvStoreImplement(AbstractStore):
     csv_store_path: str = "data/xhs"
 
-    def make_save_file_name(self, store_type: str) -> str:
-        return f"{self.csv_store_path}/{store_type}_{utils.get_current_date()}.csv"
+    def __init__(self):
+        self.content_writer = CsvWriter(self.csv_store_path, "contents", XHS_NOTE_CSV_COLUMNS)
+        self.comment_writer = CsvWriter(self.csv_store_path, "comments", XHS_NOTE_COMMENT_CSV_COLUMNS)
+        self.creator_writer = CsvWriter(self.csv_store_path, "creators", XHS_CREATOR_CSV_COLUMNS)
+        self.writers = [self.content_writer, self.comment_writer, self.creator_writer]
 
-    async def save_data_to_csv(self, save_item: Dict, store_type: str):
-        pathlib.Path(self.csv_store_path).mkdir(parents=True, exist_ok=True)
-        save_file_name = self.make_save_file_name(store_type=store_type)
-        async with aiofiles.open(save_file_name, mode='a+', encoding='utf-8-sig', newline='') as f:
-            f.fileno()
-            writer = csv.writer(f)
-            if await f.tell() == 0:
-                await writer.writerow(save_item.keys())
-            await writer.writerow(save_item.values())
+    async def flush(self):
+        for writer in self.writers:
+            await writer.flush()
+
+    async def close(self):
+        for writer in self.writers:
+            await writer.close()
 
     async def store_comment(self, comment_item: Dict):
-        await self.save_data_to_csv(save_item=comment_item, store_type='contents')
+        await self.comment_writer.write([comment_item])
+
+    async def store_comments(self, comment_items: List[Dict]):
+        await self.comment_writer.write(comment_items)
 
     async def store_content(self, content_item: Dict):
-        await self.save_data_to_csv(save_item=content_item, store_type='comments')
+        await self.content_writer.write([content_item])
+
+    async def store_contents(self, content_items: List[Dict]):
+        await self.content_writer.write(content_items)
 
     async def store_creator(self, creator: Dict):
-        await self.save_data_to_csv(save_item=creator, store_type='creator')
+        await self.creator_writer.write([creator])
 
 
 class XhsJsonStoreImplement(AbstractStore):
+    """
+    json lines 存储，每条数据追加写入一行，按日期和文件大小切分文件
+    笔记按 note_id 建立偏移量索引，支持增量爬取时查询已存储的笔记
+    """
     json_store_path: str = "data/xhs"
-    lock = asyncio.Lock()
-
-    def make_save_file_name(self, store_type: str) -> str:
-        return f"{self.csv_store_path}/{store_type}_{utils.get_current_date()}.csv"
-
-    async def save_data_to_json(self, save_item: Dict, store_type: str):
-        pathlib.Path(self.json_store_path).mkdir(parents=True, exist_ok=True)
-        save_file_name = self.make_save_file_name(store_type=store_type)
-        save_data = []
-        async with self.lock:
-            if os.path.exists(save_file_name):
-                async with aiofiles.open(save_file_name, 'r', encoding='utf-8') as file:
-                    save_data = json.loads(await file.read())
-            save_data.append(save_data)
-            async with aiofiles.open(save_file_name, 'w', encoding='utf-8') as file:
-                await file.write(json.dumps(save_data, ensure_ascii=False))
+
+    def __init__(self):
+        max_bytes = config.JSONL_MAX_FILE_SIZE_MB * 1024 * 1024
+        self.content_writer = JsonLinesWriter(self.json_store_path, "contents", max_bytes,
+                                              config.JSONL_COMPRESS_ROTATED, index_key="note_id")
+        self.comment_writer = JsonLinesWriter(self.json_store_path, "comments", max_bytes,
+                                              config.JSONL_COMPRESS_ROTATED)
+        self.creator_writer = JsonLinesWriter(self.json_store_path, "creators", max_bytes,
+                                              config.JSONL_COMPRESS_ROTATED)
+        self.writers = [self.content_writer, self.comment_writer, self.creator_writer]
+
+    async def open(self):
+        for writer in self.writers:
+            await writer.open()
+
+    async def flush(self):
+        for writer in self.writers:
+            await writer.flush()
+
+    async def close(self):
+        for writer in self.writers:
+            await writer.close()
+
+    async def store_content(self, content_item: Dict):
+        await self.content_writer.write([content_item])
+
+    async def store_contents(self, content_items: List[Dict]):
+        await self.content_writer.write(content_items)
 
     async def store_comment(self, comment_item: Dict):
-        pass
+        await self.comment_writer.write([comment_item])
+
+    async def store_comments(self, comment_items: List[Dict]):
+        await self.comment_writer.write(comment_items)
+
+    async def store_creator(self, creator: Dict):
+        await self.creator_writer.write([creator])
+
+    async def query_content_state(self, content_id: str) -> Optional[Dict]:
+        return await self.content_writer.read(content_id)
+
+
+def make_parquet_columns(model: Type[Model], columns: List[str]) -> Dict[str, str]:
+    """根据表字段类型生成 parquet 列类型，时间戳使用 timestamp 类型，取值重复较多的列使用字典编码"""
+    timestamp_columns = {"time", "last_update_time", "create_time", "last_modify_ts"}
+    dictionary_columns = {"ip_location", "nickname", "type", "gender"}
+    parquet_columns = {}
+    for column in columns:
+        if column in timestamp_columns:
+            parquet_columns[column] = "timestamp"
+        elif column in dictionary_columns:
+            parquet_columns[column] = "dictionary"
+        elif model._meta.fields_map[column].field_type is int:
+            parquet_columns[column] = "int64"
+        else:
+            parquet_columns[column] = "string"
+    return parquet_columns
+
+
+class XhsParquetStoreImplement(AbstractStore):
+    """parquet 列式存储，按天分区，适合下游分析查询"""
+    parquet_store_path: str = "data/xhs/parquet"
+
+    def __init__(self):
+        self.content_writer = ParquetWriter(
+            self.parquet_store_path, "contents", make_parquet_columns(XHSNote, XHS_NOTE_CSV_COLUMNS),
+            config.PARQUET_ROW_GROUP_SIZE, config.PARQUET_COMPRESSION
+        )
+        self.comment_writer = ParquetWriter(
+            self.parquet_store_path, "comments", make_parquet_columns(XHSNoteComment, XHS_NOTE_COMMENT_CSV_COLUMNS),
+            config.PARQUET_ROW_GROUP_SIZE, config.PARQUET_COMPRESSION
+        )
+        self.creator_writer = ParquetWriter(
+            self.parquet_store_path, "creators", make_parquet_columns(XhsCreator, XHS_CREATOR_CSV_COLUMNS),
+            config.PARQUET_ROW_GROUP_SIZE, config.PARQUET_COMPRESSION
+        )
+        self.writers = [self.content_writer, self.comment_writer, self.creator_writer]
+
+    async def close(self):
+        for writer in self.writers:
+            await writer.close()
 
     async def store_content(self, content_item: Dict):
-        pass
+        await self.content_writer.write([content_item])
+
+    async def store_contents(self, content_items: List[Dict]):
+        await self.content_writer.write(content_items)
+
+    async def store_comment(self, comment_item: Dict):
+        await self.comment_writer.write([comment_item])
+
+    async def store_comments(self, comment_items: List[Dict]):
+        await self.comment_writer.write(comment_items)
+
+    async def store_creator(self, creator: Dict):
+        await self.creator_writer.write([creator])
+
+
+def make_sqlite_columns(model: Type[Model], columns: List[str]) -> Dict[str, str]:
+    """根据表字段类型生成 sqlite 列类型"""
+    return {column: "INTEGER" if model._meta.fields_map[column].field_type is int else "TEXT" for column in columns}
+
+
+class XhsSqliteStoreImplement(AbstractStore):
+    """sqlite 存储，单机部署不需要 MySQL，表结构和 MySQL 保持一致"""
+    note_table = SqliteTable("xhs_note", make_sqlite_columns(XHSNote, XHS_NOTE_CSV_COLUMNS), unique_key="note_id",
+                             indexes=("time", "liked_count_num", "collected_count_num", "comment_count_num",
+                                      "share_count_num"),
+                             hash_column="content_hash" if config.ENABLE_CONTENT_HASH_SKIP else None)
+    comment_table = SqliteTable("xhs_note_comment", make_sqlite_columns(XHSNoteComment, XHS_NOTE_COMMENT_CSV_COLUMNS),
+                                unique_key="comment_id",
+                                indexes=(("note_id", "create_time"), "create_time", "parent_comment_id"),
+                                hash_column="content_hash" if config.ENABLE_CONTENT_HASH_SKIP else None)
+
+    def __init__(self):
+        self.client = SqliteClient(config.SQLITE_DB_PATH)
+
+    async def open(self):
+        await self.client.open([self.note_table, self.comment_table])
+
+    async def close(self):
+        await self.client.close()
+
+    async def store_content(self, content_item: Dict):
+        await self.store_contents([content_item])
+
+    async def store_contents(self, content_items: List[Dict]):
+        await self.client.upsert(self.note_table, content_items, utils.get_current_timestamp())
+
+    async def store_comment(self, comment_item: Dict):
+        await self.store_comments([comment_item])
+
+    async def store_comments(self, comment_items: List[Dict]):
+        await self.client.upsert(self.comment_table, comment_items, utils.get_current_timestamp())
 
     async def store_creator(self, creator: Dict):
         pass
+
+    async def query_content_state(self, content_id: str) -> Optional[Dict]:
+        rows = await self.client.fetchall(
+            "SELECT last_update_time, comment_count FROM xhs_note WHERE note_id = ?", (content_id,)
+        )
+        if not rows:
+            return None
+        return {"last_update_time": rows[0][0], "comment_count": rows[0][1]}
+
+    async def query_stored_comment_ids(self, comment_ids: List[str]) -> Set[str]:
+        if not comment_ids:
+            return set()
+        rows = await self.client.fetchall(
+            f"SELECT comment_id FROM xhs_note_comment WHERE comment_id IN ({', '.join('?' for _ in comment_ids)})",
+            comment_ids
+        )
+        return {row[0] for row in rows}
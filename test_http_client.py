@@ -0,0 +1,161 @@
+# XHSClient 连接池的离线测试和吞吐量测试，使用本地的 HTTP/1.1 桩服务代替小红书接口
+#   python -m pytest -q test_http_client.py     只做连接复用和 HTTP/2 回退校验
+#   python test_http_client.py                  校验 + 每秒请求数对比(连接池 vs 每个请求新建客户端)
+import asyncio
+import json
+import sys
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from base.base_crawler import AbstractSigner
+from media_platform.xhs.client import XHSClient
+
+RESPONSE_BODY = json.dumps({"success": True, "data": {"items": []}}).encode()
+
+
+class StubServer:
+    """返回固定 JSON 的 keep-alive HTTP 服务，统计建立过的连接数和处理过的请求数"""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self.handle_connection, "127.0.0.1", 0)
+
+    async def close(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                content_length = 0
+                while True:
+                    header_line = await reader.readline()
+                    if header_line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header_line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        content_length = int(value.strip())
+                if content_length:
+                    await reader.readexactly(content_length)
+                self.requests += 1
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(RESPONSE_BODY), RESPONSE_BODY))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class StubSigner(AbstractSigner):
+    async def sign(self, uri: str, data: Optional[Dict] = None) -> Dict[str, str]:
+        return {"X-S": "stub", "X-T": "0"}
+
+    async def update_cookies(self, cookie_dict: Dict[str, str]):
+        pass
+
+
+def create_client(server: StubServer, http2: bool = False) -> XHSClient:
+    client = XHSClient(headers={"User-Agent": "test"}, playwright_page=None, cookie_dict={},
+                       signer=StubSigner(), http2=http2,
+                       limits=httpx.Limits(max_connections=10, max_keepalive_connections=10))
+    client._host = server.url
+    return client
+
+
+async def run_pooled(server: StubServer, total: int, concurrency: int) -> None:
+    """复用 XHSClient 的长连接池并发发送请求"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(i: int):
+        async with semaphore:
+            await client.get("/api/sns/web/v2/comment/page", {"note_id": str(i)})
+
+    async with create_client(server) as client:
+        await asyncio.gather(*[send(i) for i in range(total)])
+
+
+async def run_per_request(server: StubServer, total: int, concurrency: int) -> None:
+    """每个请求新建一个 httpx 客户端，即改用连接池之前的请求方式"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(i: int):
+        async with semaphore:
+            async with httpx.AsyncClient() as http_client:
+                response = await http_client.get(f"{server.url}/api/sns/web/v2/comment/page?note_id={i}")
+                response.json()
+
+    await asyncio.gather(*[send(i) for i in range(total)])
+
+
+async def check_connection_reuse():
+    server = StubServer()
+    await server.start()
+    try:
+        await run_pooled(server, total=200, concurrency=10)
+        assert server.requests == 200
+        assert server.connections <= 10, server.connections
+    finally:
+        await server.close()
+
+
+async def check_http2_fallback():
+    server = StubServer()
+    await server.start()
+    saved = sys.modules.get("h2")
+    # 模拟没有安装 h2，开启 HTTP/2 时应退回 HTTP/1.1 而不是在创建客户端时报错
+    sys.modules["h2"] = None
+    try:
+        async with create_client(server, http2=True) as client:
+            assert client.http2 is False
+            assert await client.get("/api/sns/web/v1/feed") == {"items": []}
+    finally:
+        if saved is None:
+            sys.modules.pop("h2", None)
+        else:
+            sys.modules["h2"] = saved
+        await server.close()
+
+
+def test_connection_reuse():
+    asyncio.run(check_connection_reuse())
+
+
+def test_http2_fallback():
+    asyncio.run(check_http2_fallback())
+
+
+async def benchmark(total: int = 2000, concurrency: int = 10):
+    """两种请求方式各发送 total 个请求，输出每秒请求数和建立的连接数"""
+    for name, run in (("pooled", run_pooled), ("per-request", run_per_request)):
+        server = StubServer()
+        await server.start()
+        try:
+            start = time.perf_counter()
+            await run(server, total, concurrency)
+            cost = time.perf_counter() - start
+        finally:
+            await server.close()
+        print(f"{name:<12} {total / cost:8.0f} req/s  {server.connections:5d} connections")
+
+
+if __name__ == '__main__':
+    test_connection_reuse()
+    test_http2_fallback()
+    print("connection reuse and http2 fallback passed")
+    asyncio.run(benchmark())
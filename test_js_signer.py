@@ -0,0 +1,60 @@
+# 无浏览器签名器 XHSJsEngineSigner 的离线测试，使用 test_sign_fixture.js 代替真实的签名脚本 (需要安装 quickjs)
+#   python -m pytest -q test_js_signer.py
+#   python test_js_signer.py
+import asyncio
+import json
+import os
+from typing import Dict, Optional
+
+from media_platform.xhs.help import sign
+from media_platform.xhs.signer import XHSJsEngineSigner
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_sign_fixture.js")
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+
+
+def expected_headers(uri: str, data: Optional[Dict], cookie_dict: Dict[str, str], b1: str) -> Dict[str, str]:
+    """按签名脚本的拼接规则在 Python 中计算同样的签名请求头"""
+    cookie_str = "; ".join(f"{key}={value}" for key, value in cookie_dict.items())
+    x_s = "XYW_" + json.dumps([uri, data, cookie_str, USER_AGENT, b1], ensure_ascii=False, separators=(",", ":"))
+    signs = sign(a1=cookie_dict.get("a1", ""), b1=b1, x_s=x_s, x_t="1700000000000")
+    return {"X-S": signs["x-s"], "X-T": signs["x-t"], "x-S-Common": signs["x-s-common"]}
+
+
+def assert_headers(headers: Dict[str, str], expected: Dict[str, str]):
+    for key, value in expected.items():
+        assert headers[key] == value, (key, headers[key], value)
+    assert len(headers["X-B3-Traceid"]) == 16
+
+
+async def run_signer():
+    cookie_dict = {"a1": "18c8e0c7a0dgl0s4mr6v", "webId": "3d7c1e9f"}
+    signer = XHSJsEngineSigner(FIXTURE_PATH, cookie_dict, {"b1": "I38rHdgsjopgIvesdVwgIC+oIELmBZ5e"}, USER_AGENT)
+    try:
+        uri = "/api/sns/web/v2/comment/page?note_id=64b7b1a0000000001e03b3a5&cursor="
+        headers = await signer.sign(uri)
+        assert_headers(headers, expected_headers(uri, None, cookie_dict, "I38rHdgsjopgIvesdVwgIC+oIELmBZ5e"))
+
+        data = {"keyword": "编程副业", "page": 1, "page_size": 20, "sort": "general"}
+        headers = await signer.sign("/api/sns/web/v1/search/notes", data)
+        assert_headers(headers, expected_headers("/api/sns/web/v1/search/notes", data, cookie_dict,
+                                                 "I38rHdgsjopgIvesdVwgIC+oIELmBZ5e"))
+
+        # 登录后 cookies 和 localStorage 更新，签名脚本读取到新的值
+        cookie_dict = {**cookie_dict, "web_session": "040069b3"}
+        await signer.update_cookies(cookie_dict)
+        await signer.update_local_storage({"b1": "new-b1"})
+        results = await asyncio.gather(*[signer.sign(f"/api/sns/web/v1/feed?i={i}") for i in range(5)])
+        for i, headers in enumerate(results):
+            assert_headers(headers, expected_headers(f"/api/sns/web/v1/feed?i={i}", None, cookie_dict, "new-b1"))
+    finally:
+        await signer.close()
+
+
+def test_js_engine_signer():
+    asyncio.run(run_signer())
+
+
+if __name__ == '__main__':
+    test_js_engine_signer()
+    print("js engine signer passed")
@@ -0,0 +1,64 @@
+# 小红书请求签名 help.py 的固定向量校验和性能测试
+# 固定向量由改写前的逐字节实现生成，保存在 test_sign_vectors.json 中，改动签名实现后运行:
+#   python -m pytest -q test_sign.py     只做结果校验
+#   python test_sign.py                  结果校验 + 性能测试
+import json
+import os
+import re
+import timeit
+
+from media_platform.xhs import help as xhs_help
+
+VECTORS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_sign_vectors.json")
+
+with open(VECTORS_PATH, encoding="utf-8") as f:
+    VECTORS = json.load(f)
+
+
+def test_mrc():
+    for vector in VECTORS["sign"]:
+        assert xhs_help.mrc(vector["x_t"] + vector["x_s"] + vector["b1"]) == vector["x9"], vector
+
+
+def test_b64_encode():
+    for vector in VECTORS["b64"]:
+        assert xhs_help.b64Encode(vector["bytes"]) == vector["encoded"], vector
+        assert xhs_help.b64Encode(bytes(vector["bytes"])) == vector["encoded"], vector
+
+
+def test_sign():
+    for vector in VECTORS["sign"]:
+        signs = xhs_help.sign(a1=vector["a1"], b1=vector["b1"], x_s=vector["x_s"], x_t=vector["x_t"])
+        assert signs["x-s"] == vector["x_s"]
+        assert signs["x-t"] == vector["x_t"]
+        assert signs["x-s-common"] == vector["x_s_common"], vector
+
+
+def test_b3_trace_id():
+    for _ in range(1000):
+        assert re.fullmatch(r"[0-9a-f]{16}", xhs_help.get_b3_trace_id())
+
+
+def benchmark(number: int = 20000):
+    """每个函数调用 number 次，输出单次调用的平均耗时"""
+    vector = VECTORS["sign"][1]
+    mrc_input = vector["x_t"] + vector["x_s"] + vector["b1"]
+    cases = {
+        "sign": lambda: xhs_help.sign(a1=vector["a1"], b1=vector["b1"], x_s=vector["x_s"], x_t=vector["x_t"]),
+        "mrc": lambda: xhs_help.mrc(mrc_input),
+        "b64Encode": lambda: xhs_help.b64Encode(xhs_help.encodeUtf8(mrc_input)),
+        "get_b3_trace_id": xhs_help.get_b3_trace_id,
+    }
+    for name, func in cases.items():
+        # 重复多轮取最快的一轮，减少机器负载波动的影响
+        cost = min(timeit.repeat(func, number=number, repeat=5)) / number
+        print(f"{name:<16} {cost * 1e6:8.2f} us/call")
+
+
+if __name__ == '__main__':
+    test_mrc()
+    test_b64_encode()
+    test_sign()
+    test_b3_trace_id()
+    print(f"{len(VECTORS['sign'])} sign vectors and {len(VECTORS['b64'])} base64 vectors passed")
+    benchmark()
@@ -0,0 +1,8 @@
+// 离线测试用的签名脚本，替代小红书页面中的签名函数，只用于校验无浏览器签名器的注入和调用流程
+// 签名结果由请求路由、请求体、cookies、User-Agent 和 localStorage 中的 b1 拼接而成，结果可以在 Python 中复现
+window._webmsxyw = function (url, data) {
+    return {
+        "X-s": "XYW_" + JSON.stringify([url, data, document.cookie, navigator.userAgent, localStorage.getItem("b1")]),
+        "X-t": 1700000000000
+    };
+};
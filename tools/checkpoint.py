@@ -0,0 +1,145 @@
+import json
+import os
+import pathlib
+import time
+from typing import Dict, List, Optional, Set, TextIO
+
+from tools import utils
+
+
+class CrawlCheckpoint:
+    """
+    爬取进度日志，追加写入的 json lines 文件，批量 fsync 落盘
+    记录每个关键词的翻页进度、已完成的笔记ID、每个笔记的评论和回复翻页游标，崩溃后可以从中断的位置继续爬取
+    日志格式:
+        {"t": "page", "kw": 关键词, "page": 页码, "notes": [笔记ID...]}           搜索到一页笔记
+        {"t": "note", "id": 笔记ID}                                              笔记(包括评论)爬取完成
+        {"t": "cursor", "id": 笔记ID, "cursor": 游标}                            笔记的一页评论已存储
+        {"t": "sub", "id": 笔记ID, "root": 一级评论ID, "cursor": 游标}           一级评论的回复从游标开始还没有爬取
+        {"t": "sub_done", "id": 笔记ID, "root": 一级评论ID}                      一级评论的回复爬取完成
+        {"t": "kw", "kw": 关键词}                                                关键词翻页结束
+    """
+
+    def __init__(self, file_path: str, fsync_every: int = 100, fsync_interval: float = 1.0):
+        """
+        :param file_path: 日志文件路径
+        :param fsync_every: 每写入多少条记录 fsync 一次
+        :param fsync_interval: 距离上一次 fsync 超过多少秒后，下一次写入时 fsync
+        """
+        self.file_path = file_path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.keyword_pages: Dict[str, int] = {}
+        self.keyword_notes: Dict[str, List[str]] = {}
+        self.finished_keywords: Set[str] = set()
+        self.finished_notes: Set[str] = set()
+        self.comment_cursors: Dict[str, str] = {}
+        # 笔记ID -> {一级评论ID: 回复游标}，空游标表示从第一页开始
+        self.sub_comment_cursors: Dict[str, Dict[str, str]] = {}
+        self._file: Optional[TextIO] = None
+        self._unsynced_count = 0
+        self._last_sync_at = time.monotonic()
+
+    def open(self, resume: bool = False) -> None:
+        """
+        打开日志文件
+        :param resume: 是否从已有的日志恢复进度，否则清空日志重新开始
+        :return:
+        """
+        pathlib.Path(self.file_path).parent.mkdir(parents=True, exist_ok=True)
+        if resume:
+            self.load()
+        self._file = open(self.file_path, "a" if resume else "w", encoding="utf-8")
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record: Dict = json.loads(line)
+                except ValueError:
+                    # 崩溃时最后一行可能只写了一半
+                    continue
+                record_type = record.get("t")
+                if record_type == "page":
+                    keyword = record["kw"]
+                    self.keyword_pages[keyword] = max(self.keyword_pages.get(keyword, 0), record["page"])
+                    self.keyword_notes.setdefault(keyword, []).extend(record["notes"])
+                elif record_type == "note":
+                    self.finished_notes.add(record["id"])
+                    self.comment_cursors.pop(record["id"], None)
+                    self.sub_comment_cursors.pop(record["id"], None)
+                elif record_type == "cursor":
+                    self.comment_cursors[record["id"]] = record["cursor"]
+                elif record_type == "sub":
+                    self.sub_comment_cursors.setdefault(record["id"], {})[record["root"]] = record["cursor"]
+                elif record_type == "sub_done":
+                    self.sub_comment_cursors.get(record["id"], {}).pop(record["root"], None)
+                elif record_type == "kw":
+                    self.finished_keywords.add(record["kw"])
+        utils.logger.info(f"[CrawlCheckpoint.load] resume from {self.file_path}, "
+                          f"finished notes: {len(self.finished_notes)}")
+
+    def pending_notes(self, keyword: str) -> List[str]:
+        """关键词下已经搜索到、但还没有爬取完成的笔记"""
+        return [note_id for note_id in dict.fromkeys(self.keyword_notes.get(keyword, []))
+                if note_id not in self.finished_notes]
+
+    def has_pending(self, keywords: List[str]) -> bool:
+        """还有没有翻页结束的关键词，或者没有爬取完成的笔记"""
+        return (any(keyword not in self.finished_keywords for keyword in keywords)
+                or any(self.pending_notes(keyword) for keyword in self.keyword_notes))
+
+    def record_page(self, keyword: str, page: int, note_ids: List[str]) -> None:
+        self.keyword_pages[keyword] = page
+        self.keyword_notes.setdefault(keyword, []).extend(note_ids)
+        self._write({"t": "page", "kw": keyword, "page": page, "notes": note_ids})
+
+    def record_note_finished(self, note_id: str) -> None:
+        self.finished_notes.add(note_id)
+        self.comment_cursors.pop(note_id, None)
+        self.sub_comment_cursors.pop(note_id, None)
+        self._write({"t": "note", "id": note_id})
+
+    def record_comment_cursor(self, note_id: str, cursor: str) -> None:
+        self._write({"t": "cursor", "id": note_id, "cursor": cursor})
+
+    def record_sub_comment_cursor(self, note_id: str, root_comment_id: str, cursor: str) -> None:
+        self._write({"t": "sub", "id": note_id, "root": root_comment_id, "cursor": cursor})
+
+    def record_sub_comments_finished(self, note_id: str, root_comment_id: str) -> None:
+        self._write({"t": "sub_done", "id": note_id, "root": root_comment_id})
+
+    def record_keyword_finished(self, keyword: str) -> None:
+        self.finished_keywords.add(keyword)
+        self._write({"t": "kw", "kw": keyword})
+
+    def close(self, finished: bool = False) -> None:
+        """
+        关闭日志文件
+        :param finished: 爬取全部完成时删除日志，下一次运行从头开始
+        :return:
+        """
+        if self._file is None:
+            return
+        self._sync()
+        self._file.close()
+        self._file = None
+        if finished:
+            os.remove(self.file_path)
+
+    def _write(self, record: Dict) -> None:
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._unsynced_count += 1
+        if (self._unsynced_count >= self.fsync_every
+                or time.monotonic() - self._last_sync_at >= self.fsync_interval):
+            self._sync()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced_count = 0
+        self._last_sync_at = time.monotonic()
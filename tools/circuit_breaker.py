@@ -0,0 +1,45 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque
+
+from tools import utils
+
+
+class CircuitBreaker:
+    """
+    熔断器：时间窗口内失败次数达到阈值后熔断，熔断期间所有请求暂停等待，冷却时间过后恢复请求
+    """
+
+    def __init__(self, failure_threshold: int = 5, window: float = 60, recovery_timeout: float = 120):
+        """
+        :param failure_threshold: 时间窗口内触发熔断的失败次数
+        :param window: 统计失败次数的时间窗口(秒)
+        :param recovery_timeout: 熔断后暂停请求的时间(秒)
+        """
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.recovery_timeout = recovery_timeout
+        self.open_count = 0
+        self._failures: Deque[float] = deque()
+        self._open_until = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    async def wait_until_closed(self) -> None:
+        while self.is_open:
+            await asyncio.sleep(self._open_until - time.monotonic())
+
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        self._failures.append(now)
+        while self._failures and now - self._failures[0] > self.window:
+            self._failures.popleft()
+        if len(self._failures) >= self.failure_threshold and not self.is_open:
+            self._open_until = now + self.recovery_timeout
+            self._failures.clear()
+            self.open_count += 1
+            utils.logger.warning(f"[CircuitBreaker.record_failure] {self.failure_threshold} failures in "
+                                 f"{self.window}s, pause all requests for {self.recovery_timeout}s")
@@ -0,0 +1,56 @@
+import re
+from typing import Dict, Iterable, List, Optional, Union
+
+# 数量后缀对应的倍数
+COUNT_UNITS: Dict[str, int] = {
+    "千": 1000,
+    "k": 1000,
+    "万": 10000,
+    "w": 10000,
+    "亿": 100000000,
+}
+
+COUNT_PATTERN = re.compile(r"^([0-9][0-9,]*(?:\.[0-9]+)?|\.[0-9]+)\s*(千|k|万|w|亿)?\s*\+?$", re.IGNORECASE)
+
+
+def parse_count(value: Union[str, int, None]) -> Optional[int]:
+    """
+    把页面上展示的数量转换成整数，例如 "1.2万" -> 12000, "10+" -> 10, "1,234" -> 1234
+    :param value: 展示的数量
+    :return: 无法解析(例如空字符串或者"赞"这类占位文字)时返回 None
+    """
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    match = COUNT_PATTERN.match(value)
+    if not match:
+        return None
+    number, unit = match.groups()
+    number = number.replace(",", "")
+    if unit is None:
+        return int(float(number))
+    # 按字符串计算小数部分，避免 1.1万 这种值因为浮点误差变成 10999
+    integer_part, _, fraction_part = number.partition(".")
+    multiplier = COUNT_UNITS[unit.lower()]
+    fraction_digits = len(fraction_part)
+    return (int(integer_part or 0) * multiplier
+            + int(fraction_part or 0) * multiplier // 10 ** fraction_digits)
+
+
+def parse_counts(values: Iterable[Union[str, int, None]]) -> List[Optional[int]]:
+    """
+    批量转换数量，同一批数据中重复的展示值(例如大量的 "10+"、"1万")只解析一次
+    :param values:
+    :return: 与输入一一对应的整数列表
+    """
+    parsed: Dict[Union[str, int, None], Optional[int]] = {}
+    results = []
+    for value in values:
+        if value not in parsed:
+            parsed[value] = parse_count(value)
+        results.append(parsed[value])
+    return results
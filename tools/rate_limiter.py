@@ -0,0 +1,106 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+
+class AdaptiveTokenBucket:
+    """
+    令牌桶限速器，按 AIMD 策略自适应调整速率
+    请求成功时速率加性增加，被限流(IP异常、HTTP 429/461)时速率乘性减少
+    """
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float, increase_step: float,
+                 decrease_factor: float, decrease_cooldown: float = 1.0):
+        """
+        :param rate: 初始速率(次/秒)
+        :param min_rate: 最小速率
+        :param max_rate: 最大速率
+        :param increase_step: 每次请求成功增加的速率
+        :param decrease_factor: 被限流时速率乘以该系数
+        :param decrease_cooldown: 同一批并发请求同时被限流时只降速一次，冷却时间内的限流信号会被忽略(秒)
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.tokens = 1.0
+        self._updated_at = time.monotonic()
+        self._last_decrease_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def capacity(self) -> float:
+        """桶容量为一秒的令牌数，允许的最大突发请求数"""
+        return max(1.0, self.rate)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttled(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease_at < self.decrease_cooldown:
+            return
+        self._last_decrease_at = now
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        # 清空令牌，避免降速后马上又发出一批请求
+        self.tokens = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+
+class RateLimiter:
+    """
+    全局 + 每个接口各一个自适应令牌桶，请求需要同时拿到全局和接口的令牌
+    某个接口被限流时只有该接口和全局降速
+    """
+
+    def __init__(self, rate: float = 2, min_rate: float = 0.2, max_rate: float = 10,
+                 increase_step: float = 0.05, decrease_factor: float = 0.5):
+        self._bucket_kwargs = dict(
+            rate=rate,
+            min_rate=min_rate,
+            max_rate=max_rate,
+            increase_step=increase_step,
+            decrease_factor=decrease_factor
+        )
+        self.global_bucket = AdaptiveTokenBucket(**self._bucket_kwargs)
+        self.endpoint_buckets: Dict[str, AdaptiveTokenBucket] = {}
+
+    async def acquire(self, endpoint: str) -> None:
+        await self._get_bucket(endpoint).acquire()
+        await self.global_bucket.acquire()
+
+    def on_success(self, endpoint: str) -> None:
+        self._get_bucket(endpoint).on_success()
+        self.global_bucket.on_success()
+
+    def on_throttled(self, endpoint: str) -> None:
+        self._get_bucket(endpoint).on_throttled()
+        self.global_bucket.on_throttled()
+
+    def metrics(self) -> Dict[str, float]:
+        """当前的全局速率和各接口速率(次/秒)"""
+        rates = {"global": self.global_bucket.rate}
+        rates.update({endpoint: bucket.rate for endpoint, bucket in self.endpoint_buckets.items()})
+        return rates
+
+    def _get_bucket(self, endpoint: str) -> AdaptiveTokenBucket:
+        bucket: Optional[AdaptiveTokenBucket] = self.endpoint_buckets.get(endpoint)
+        if bucket is None:
+            bucket = AdaptiveTokenBucket(**self._bucket_kwargs)
+            self.endpoint_buckets[endpoint] = bucket
+        return bucket
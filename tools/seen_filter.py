@@ -0,0 +1,146 @@
+import hashlib
+import math
+import os
+import pathlib
+import struct
+import time
+from typing import Dict, Optional
+
+from tools import utils
+
+
+class BloomFilter:
+    """布隆过滤器，位数组用 bytearray 存储，每个元素只占约 1.2~2 字节"""
+    # 文件头: 格式标识, 容量, 误判率, 位数, 哈希次数, 元素数量
+    # 位数和哈希次数直接保存，读取时不再由误判率重新计算，避免浮点取整不同导致位置对不上
+    _magic = b"BLM2"
+    _header = struct.Struct("<4sQdQIQ")
+    # 旧格式文件头: 容量, 误判率 * 1e9, 元素数量
+    _legacy_header = struct.Struct("<QII")
+
+    def __init__(self, capacity: int, error_rate: float, bits: Optional[bytearray] = None, count: int = 0,
+                 num_bits: Optional[int] = None, num_hashes: Optional[int] = None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = num_bits or max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = num_hashes or max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    def _positions(self, key: str):
+        # 双重哈希：一次 blake2b 得到两个64位哈希值，组合出 k 个位置
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_bytes(self) -> bytes:
+        return self._header.pack(self._magic, self.capacity, self.error_rate, self.num_bits, self.num_hashes,
+                                 self.count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        if not data.startswith(cls._magic):
+            capacity, error_rate, count = cls._legacy_header.unpack_from(data)
+            return cls(capacity, error_rate / 1e9, bytearray(data[cls._legacy_header.size:]), count)
+        _, capacity, error_rate, num_bits, num_hashes, count = cls._header.unpack_from(data)
+        bits = bytearray(data[cls._header.size:])
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError(f"bloom filter expects {(num_bits + 7) // 8} bytes, got {len(bits)}")
+        return cls(capacity, error_rate, bits, count, num_bits=num_bits, num_hashes=num_hashes)
+
+
+class SeenFilter:
+    """
+    持久化的已爬取ID过滤器，按天分代的布隆过滤器，每天一个文件
+    查询时检查TTL天数内的所有过滤器，过期的整个文件直接删除，不需要逐个元素维护过期时间
+    布隆过滤器存在很小概率的误判(把没爬过的当成爬过)，不会漏判
+    """
+
+    def __init__(self, store_dir: str, name: str, ttl_days: int = 1, capacity: int = 100000,
+                 error_rate: float = 0.001, save_every: int = 1000):
+        """
+        :param store_dir: 过滤器文件保存目录
+        :param name: 过滤器名称，用作文件名前缀
+        :param ttl_days: 过期天数
+        :param capacity: 每天预计写入的ID数量
+        :param error_rate: 误判率
+        :param save_every: 每新增多少个ID保存一次
+        """
+        self.store_dir = store_dir
+        self.name = name
+        self.ttl_days = ttl_days
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.save_every = save_every
+        self.generations: Dict[str, BloomFilter] = {}
+        self._unsaved_count = 0
+        self.load()
+
+    @staticmethod
+    def _day(days_ago: int = 0) -> str:
+        return time.strftime("%Y%m%d", time.localtime(time.time() - days_ago * 86400))
+
+    def _file_path(self, day: str) -> str:
+        return os.path.join(self.store_dir, f"{self.name}_{day}.bloom")
+
+    def load(self) -> None:
+        """加载TTL内的过滤器，删除过期的过滤器文件"""
+        pathlib.Path(self.store_dir).mkdir(parents=True, exist_ok=True)
+        live_days = {self._day(days_ago) for days_ago in range(self.ttl_days)}
+        for file_name in os.listdir(self.store_dir):
+            if not (file_name.startswith(f"{self.name}_") and file_name.endswith(".bloom")):
+                continue
+            day = file_name[len(self.name) + 1:-len(".bloom")]
+            file_path = os.path.join(self.store_dir, file_name)
+            if day not in live_days:
+                os.remove(file_path)
+                continue
+            try:
+                with open(file_path, "rb") as f:
+                    self.generations[day] = BloomFilter.from_bytes(f.read())
+            except (OSError, ValueError, struct.error) as e:
+                utils.logger.error(f"[SeenFilter.load] load {file_path} error: {e}")
+
+    def __contains__(self, key: str) -> bool:
+        return any(key in bloom_filter for bloom_filter in self.generations.values())
+
+    def add(self, key: str) -> bool:
+        """
+        添加ID
+        :param key:
+        :return: ID之前不存在返回 True，已存在返回 False
+        """
+        if key in self:
+            return False
+        today = self._day()
+        if today not in self.generations:
+            self.generations[today] = BloomFilter(self.capacity, self.error_rate)
+            live_days = {self._day(days_ago) for days_ago in range(self.ttl_days)}
+            for day in [day for day in self.generations if day not in live_days]:
+                del self.generations[day]
+        self.generations[today].add(key)
+        self._unsaved_count += 1
+        if self._unsaved_count >= self.save_every:
+            self.save()
+        return True
+
+    def save(self) -> None:
+        """保存当天的过滤器，先写临时文件再替换，避免中途崩溃损坏文件"""
+        today = self._day()
+        if today not in self.generations:
+            return
+        file_path = self._file_path(today)
+        tmp_file_path = f"{file_path}.tmp"
+        with open(tmp_file_path, "wb") as f:
+            f.write(self.generations[today].to_bytes())
+        os.replace(tmp_file_path, file_path)
+        self._unsaved_count = 0
@@ -0,0 +1,45 @@
+import json
+import os
+import pathlib
+from typing import Dict, Optional
+
+
+class SearchWatermark:
+    """
+    按关键词记录上一次爬取到的最新内容时间(水位线)，保存在本地json文件中
+    按最新排序搜索时，翻页结果越过水位线说明后面都是已经爬取过的内容，可以停止翻页
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.previous: Dict[str, int] = {}
+        self.current: Dict[str, int] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, encoding="utf-8") as f:
+            self.previous = json.load(f)
+        self.current = dict(self.previous)
+
+    def get(self, keyword: str) -> Optional[int]:
+        """上一次运行结束时的水位线"""
+        return self.previous.get(keyword)
+
+    def is_crossed(self, keyword: str, content_time: int) -> bool:
+        """内容时间不晚于上一次的水位线，说明已经爬取过"""
+        watermark = self.previous.get(keyword)
+        return watermark is not None and content_time <= watermark
+
+    def update(self, keyword: str, content_time: int) -> None:
+        if content_time > self.current.get(keyword, 0):
+            self.current[keyword] = content_time
+
+    def save(self) -> None:
+        """先写临时文件再替换，避免中途崩溃损坏文件"""
+        pathlib.Path(self.file_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_file_path = f"{self.file_path}.tmp"
+        with open(tmp_file_path, "w", encoding="utf-8") as f:
+            json.dump(self.current, f, ensure_ascii=False)
+        os.replace(tmp_file_path, self.file_path)